@@ -0,0 +1,61 @@
+import argparse
+import glob
+import os
+import timeit
+from utilities import client, tables
+from modules.collector.players_data import PLAYERS_ENDPOINT
+from modules.collector.prices_data import PRICES_ENDPOINT
+
+SAMPLES_PATH = 'benchmarks/samples/'
+
+# usage:
+#   python -m benchmarks.breakdown_table --record 620 730 570   saves the players and prices pages of these apps
+#   python -m benchmarks.breakdown_table                        times the extraction on every saved page
+
+
+def record_samples(appids, path=SAMPLES_PATH):
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+    for appid in appids:
+        for name, endpoint in [('players', PLAYERS_ENDPOINT), ('prices', PRICES_ENDPOINT)]:
+            response = client.get(endpoint.format(appid))
+            if response.status_code == 200:
+                with open(f'{path}{name}_{appid}.html', 'w', encoding='utf-8') as handle:
+                    handle.write(response.text)
+
+
+def run_benchmark(path=SAMPLES_PATH, number=20):
+    pages = []
+    for file in sorted(glob.glob(path + '*.html')):
+        with open(file, encoding='utf-8') as handle:
+            pages.append((os.path.basename(file), handle.read()))
+
+    if not pages:
+        print(f'No sample pages in {path}, record some with --record')
+        return
+
+    print(f'{"page":<30}{"size, KB":>10}{"full, ms":>12}{"fast, ms":>12}{"speedup":>10}  same rows')
+    total_full, total_fast = 0, 0
+    for name, html in pages:
+        full = timeit.timeit(lambda: tables.get_rows_full(html, tables.BREAKDOWN_TABLE_CLASS), number=number) / number
+        fast = timeit.timeit(lambda: tables.get_rows_fast(html, tables.BREAKDOWN_TABLE_CLASS), number=number) / number
+        same = tables.get_rows_full(html, tables.BREAKDOWN_TABLE_CLASS) == tables.get_rows_fast(
+            html, tables.BREAKDOWN_TABLE_CLASS)
+        total_full += full
+        total_fast += fast
+        print(f'{name:<30}{len(html) / 1024:>10.1f}{full * 1000:>12.2f}{fast * 1000:>12.2f}{full / fast:>10.1f}  {same}')
+
+    print(f'{"total":<30}{"":>10}{total_full * 1000:>12.2f}{total_fast * 1000:>12.2f}{total_full / total_fast:>10.1f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='breakdown-table extraction micro-benchmark')
+    parser.add_argument('--record', nargs='+', type=int, metavar='APPID', help='save sample pages for these appids')
+    parser.add_argument('--samples', default=SAMPLES_PATH)
+    parser.add_argument('--number', type=int, default=20, help='runs per page')
+    args = parser.parse_args()
+
+    if args.record:
+        record_samples(args.record, args.samples)
+    run_benchmark(args.samples, args.number)
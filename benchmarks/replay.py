@@ -0,0 +1,228 @@
+import argparse
+import os
+import json
+import time
+import shutil
+import tempfile
+import resource
+import multiprocessing
+import contextlib
+from benchmarks import standin
+
+# usage:
+#   python -m benchmarks.replay --record 620 730 570     runs every scenario live through the stand-in and records it
+#   python -m benchmarks.replay --latency 0.1 --jitter 0.2 --too-many 0.01 --unavailable 0.01
+#   python -m benchmarks.replay --scenarios prices players --rate-limit steampricehistory.com=10/1
+# every scenario runs in its own process in an empty temporary folder, against the stand-in only
+
+HOSTS = ['api.steampowered.com', 'store.steampowered.com', 'steamspy.com', 'steamplayercount.com',
+         'steampricehistory.com', 'api.igdb.com', 'id.twitch.tv']
+SCENARIOS = ['basic_info', 'rating', 'steamspy', 'current_prices', 'prices', 'players', 'igdb', 'update_data']
+APPIDS_FILE = 'appids.json'
+ALL_APPS_PATH = '/ISteamApps/GetAppList/v2/'
+
+# the client paces every host to the limits of the real upstream, against the stand-in only its own limits
+# (--rate-limit, injected 429s) may slow the collector down, so the client starts far above them and backs off
+UNLIMITED_RATE = (1000, 1000)
+# the SteamSpy page period and appdetails rate are scaled together, so the bulk listing is chosen as it would be live
+STEAMSPY_SPEEDUP = 1000
+
+
+def run_scenario(name, appids):
+    from modules import collector
+    from modules.collector import steam_data, steamspy_data, prices_data, players_data, igdb_data
+
+    if name == 'basic_info':
+        steam_data.get_basic_info(appids, use_async=True)
+    elif name == 'rating':
+        steam_data.get_rating_df(appids, use_async=True)
+    elif name == 'steamspy':
+        steamspy_data.get_steamspy_df(appids)
+    elif name == 'current_prices':
+        steam_data.get_current_prices(appids)
+    elif name == 'prices':
+        prices_data.get_all_prices(appids)
+    elif name == 'players':
+        players_data.get_all_player_stats(appids, [None] * len(appids))
+    elif name == 'igdb':
+        igdb_data.get_igdb_info(igdb_data.get_igdb_ids(appids)['igdbid'])
+    elif name == 'update_data':
+        collector.update_data()
+    else:
+        raise ValueError(f'unknown scenario {name}, choose from {SCENARIOS}')
+
+
+# lifts the rate limits of the client and of SteamSpy pages for the duration of a run and restores them afterwards
+@contextlib.contextmanager
+def lifted_client_limits():
+    from modules.collector import steamspy_data
+    from utilities import client
+
+    saved = (dict(client.HOST_RATES), dict(client.HOST_BUDGETS), client.DEFAULT_RATE,
+             steamspy_data.PAGE_PERIOD, steamspy_data.APPDETAILS_PER_MINUTE)
+    client.HOST_RATES.update({host: UNLIMITED_RATE for host in HOSTS})
+    client.HOST_BUDGETS.clear()
+    client.DEFAULT_RATE = UNLIMITED_RATE
+    steamspy_data.PAGE_PERIOD /= STEAMSPY_SPEEDUP
+    steamspy_data.APPDETAILS_PER_MINUTE *= STEAMSPY_SPEEDUP
+    client.limiters.clear()
+    try:
+        yield
+    finally:
+        client.HOST_RATES.clear()
+        client.HOST_RATES.update(saved[0])
+        client.HOST_BUDGETS.update(saved[1])
+        client.DEFAULT_RATE, steamspy_data.PAGE_PERIOD, steamspy_data.APPDETAILS_PER_MINUTE = saved[2:]
+        client.limiters.clear()
+
+
+# runs in a child process, so the peak memory is that of the scenario alone
+# recording goes through to the real upstreams, so it keeps the client limits
+def measure(name, appids, base_url, workdir, secrets_path, results, recording=False):
+    from modules.collector import igdb_data
+    from utilities import client, metrics
+
+    os.chdir(workdir)
+    client.REDIRECTS.update({host: base_url for host in HOSTS})
+    igdb_data.SECRETS_PATH = secrets_path
+
+    metrics.reset()
+    with contextlib.nullcontext() if recording else lifted_client_limits():
+        started = time.perf_counter()
+        run_scenario(name, appids)
+        seconds = time.perf_counter() - started
+
+    report = metrics.get_report()
+    statuses = {}
+    for host in report['requests'].values():
+        for status, count in host['statuses'].items():
+            statuses[status] = statuses.get(status, 0) + count
+
+    results.put({'scenario': name,
+                 'seconds': seconds,
+                 'requests': sum(host['count'] for host in report['requests'].values()),
+                 'statuses': statuses,
+                 'bytes': sum(host['bytes'] for host in report['requests'].values()),
+                 'latency': metrics.get_latency_quantiles(),
+                 'waits': sum(wait['seconds'] for wait in report['rate_limit_waits'].values()),
+                 'peak_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024})
+
+
+def run_in_process(name, appids, base_url, secrets_path, recording=False):
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    workdir = tempfile.mkdtemp(prefix=f'replay_{name}_')
+    try:
+        process = context.Process(target=measure,
+                                  args=(name, appids, base_url, workdir, secrets_path, results, recording))
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+            return {'scenario': name, 'error': f'exit code {process.exitcode}'}
+        return results.get()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+# the real app list has every app on Steam, the recorded one only has the benchmark appids
+def record_app_list(recordings, appids):
+    body = json.dumps({'applist': {'apps': [{'appid': appid, 'name': ''} for appid in appids]}}).encode()
+    key = standin.get_key('GET', 'api.steampowered.com', ALL_APPS_PATH, '', b'')
+    recordings.save('api.steampowered.com', key, 200, {'Content-Type': 'application/json'}, body)
+
+    with open(os.path.join(recordings.path, APPIDS_FILE), 'w') as handle:
+        json.dump(appids, handle)
+
+
+def record(appids, path=standin.RECORDINGS_PATH, secrets_path='secrets.txt'):
+    recordings = standin.Recordings(path)
+    record_app_list(recordings, appids)
+
+    server = standin.start_server(recordings=recordings, record=True)
+    base_url = f'http://127.0.0.1:{server.server_address[1]}'
+    try:
+        for name in SCENARIOS:
+            print(f'recording {name}')
+            run_in_process(name, appids, base_url, os.path.abspath(secrets_path), recording=True)
+    finally:
+        server.shutdown()
+
+    # the recorded token is of no use to anybody, but it is not shipped either
+    token_path = os.path.join(path, 'id.twitch.tv')
+    if os.path.exists(token_path):
+        for key in [file[:-len('.json')] for file in os.listdir(token_path)]:
+            recording = recordings.load('id.twitch.tv', key)
+            token = json.loads(recording['body'])
+            token['access_token'] = 'replay'
+            recordings.save('id.twitch.tv', key, recording['status'], recording['headers'], json.dumps(token).encode())
+
+
+def run_benchmark(scenarios, behaviour, path=standin.RECORDINGS_PATH):
+    appids_path = os.path.join(path, APPIDS_FILE)
+    if not os.path.exists(appids_path):
+        print(f'No recordings in {path}, record some with --record')
+        return []
+    with open(appids_path) as handle:
+        appids = json.load(handle)
+
+    workdir = tempfile.mkdtemp(prefix='replay_secrets_')
+    secrets_path = os.path.join(workdir, 'secrets.txt')
+    with open(secrets_path, 'w') as handle:
+        handle.write('replay\nreplay\n')
+
+    server = standin.start_server(recordings=standin.Recordings(path), behaviour=behaviour)
+    base_url = f'http://127.0.0.1:{server.server_address[1]}'
+    results = []
+    try:
+        print(f'{"scenario":<16}{"seconds":>9}{"requests":>10}{"req/s":>9}{"apps/s":>9}{"p50, ms":>9}'
+              f'{"p95, ms":>9}{"p99, ms":>9}{"429":>6}{"503":>6}{"waits, s":>10}{"peak, MB":>10}')
+        for name in scenarios:
+            result = run_in_process(name, appids, base_url, secrets_path)
+            results.append(result)
+            if 'error' in result:
+                print(f'{name:<16}{result["error"]}')
+                continue
+
+            latency = {key: value * 1000 for key, value in result['latency'].items()}
+            print(f'{name:<16}{result["seconds"]:>9.2f}{result["requests"]:>10}'
+                  f'{result["requests"] / result["seconds"]:>9.1f}{len(appids) / result["seconds"]:>9.1f}'
+                  f'{latency.get("p50", 0):>9.1f}{latency.get("p95", 0):>9.1f}{latency.get("p99", 0):>9.1f}'
+                  f'{result["statuses"].get("429", 0):>6}{result["statuses"].get("503", 0):>6}'
+                  f'{result["waits"]:>10.2f}{result["peak_mb"]:>10.1f}')
+    finally:
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return results
+
+
+def parse_rate_limit(value):
+    host, _, budget = value.partition('=')
+    count, _, period = budget.partition('/')
+    return host, (float(count), float(period or 1))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='collector throughput against a local stand-in of every upstream')
+    parser.add_argument('--record', nargs='+', type=int, metavar='APPID', help='record responses for these appids')
+    parser.add_argument('--recordings', default=standin.RECORDINGS_PATH)
+    parser.add_argument('--scenarios', nargs='+', default=SCENARIOS, choices=SCENARIOS)
+    parser.add_argument('--latency', type=float, default=0.05, help='minimum response latency, seconds')
+    parser.add_argument('--jitter', type=float, default=0.05, help='random extra latency up to this, seconds')
+    parser.add_argument('--slow', type=float, default=0.0, help='share of responses taking --slow-latency')
+    parser.add_argument('--slow-latency', type=float, default=2.0)
+    parser.add_argument('--rate-limit', nargs='+', type=parse_rate_limit, default=[], metavar='HOST=COUNT/SECONDS')
+    parser.add_argument('--too-many', type=float, default=0.0, help='share of responses replaced with 429')
+    parser.add_argument('--unavailable', type=float, default=0.0, help='share of responses replaced with 503')
+    parser.add_argument('--output', help='save the results as JSON here')
+    args = parser.parse_args()
+
+    if args.record:
+        record(args.record, args.recordings)
+
+    behaviour = standin.Behaviour(args.latency, args.jitter, args.slow, args.slow_latency, dict(args.rate_limit),
+                                  args.too_many, args.unavailable)
+    benchmark_results = run_benchmark(args.scenarios, behaviour, args.recordings)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(benchmark_results, output, indent=2)
@@ -0,0 +1,171 @@
+import os
+import json
+import time
+import base64
+import random
+import hashlib
+import threading
+import requests
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qsl, urlencode
+from utilities.limiter import TokenBucket
+
+RECORDINGS_PATH = 'benchmarks/recordings/'
+
+# credentials are never part of a recording key, so recordings replay with any secrets
+IGNORED_PARAMS = {'client_id', 'client_secret'}
+RECORDED_HEADERS = ['Content-Type', 'ETag', 'Last-Modified']
+FORWARDED_HEADERS = ['Authorization', 'Client-ID', 'Content-Type']
+
+# a local stand-in for every upstream service: requests come in as /<host>/<path>?<query>
+# (see utilities.client.REDIRECTS) and are answered from recordings, with injected latency, rate limits and errors
+# in record mode, requests without a recording are forwarded to the real host and their responses are recorded
+
+
+def get_key(method, host, path, query, body):
+    params = sorted((key, value) for key, value in parse_qsl(query, keep_blank_values=True)
+                    if key not in IGNORED_PARAMS)
+    request = f'{method} {host}{path}?{urlencode(params)}'.encode() + b'\n' + (body or b'')
+    return hashlib.sha1(request).hexdigest()
+
+
+class Recordings:
+    def __init__(self, path=RECORDINGS_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def get_path(self, host, key):
+        return os.path.join(self.path, host, f'{key}.json')
+
+    def load(self, host, key):
+        path = self.get_path(host, key)
+        if not os.path.exists(path):
+            return None
+        with open(path) as handle:
+            recording = json.load(handle)
+        recording['body'] = base64.b64decode(recording['body'])
+        return recording
+
+    def save(self, host, key, status, headers, body):
+        path = self.get_path(host, key)
+        with self.lock:
+            if not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as handle:
+            json.dump({'status': status, 'headers': headers, 'body': base64.b64encode(body).decode()}, handle)
+
+
+# latency is uniform in [latency, latency + jitter] seconds, a share of slow_rate requests takes slow_latency instead
+# rate_limits maps a host to (count, period): requests over the budget get 429 with Retry-After
+# too_many_rate and unavailable_rate are shares of requests answered with 429 and 503 at random
+class Behaviour:
+    def __init__(self, latency=0.0, jitter=0.0, slow_rate=0.0, slow_latency=0.0, rate_limits=None,
+                 too_many_rate=0.0, unavailable_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.buckets = {host: TokenBucket(count / period, count) for host, (count, period) in
+                        (rate_limits or {}).items()}
+        self.too_many_rate = too_many_rate
+        self.unavailable_rate = unavailable_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def get_delay(self):
+        with self.lock:
+            if self.random.random() < self.slow_rate:
+                return self.slow_latency
+            return self.latency + self.random.uniform(0, self.jitter)
+
+    # status code to answer with instead of the recording, None if the recording should be served
+    def get_injected_status(self, host):
+        if host in self.buckets and self.buckets[host].reserve() > 0:
+            return 429
+        with self.lock:
+            draw = self.random.random()
+        if draw < self.too_many_rate:
+            return 429
+        if draw < self.too_many_rate + self.unavailable_rate:
+            return 503
+        return None
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'StandIn'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+    def handle_request(self, method):
+        parts = urlsplit(self.path)
+        host, _, path = parts.path.lstrip('/').partition('/')
+        path = '/' + path
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length) if length else b''
+
+        time.sleep(self.server.behaviour.get_delay())
+
+        status = self.server.behaviour.get_injected_status(host)
+        if status is not None:
+            self.respond(status, {'Retry-After': '1'} if status == 429 else {}, b'')
+            return
+
+        key = get_key(method, host, path, parts.query, body)
+        recording = self.server.recordings.load(host, key)
+        if recording is None and self.server.record:
+            recording = self.forward(method, host, path, parts.query, body, key)
+        if recording is None:
+            self.respond(404, {}, b'')
+            return
+
+        etag = recording['headers'].get('ETag')
+        if etag and self.headers.get('If-None-Match') == etag:
+            self.respond(304, {'ETag': etag}, b'')
+            return
+        self.respond(recording['status'], recording['headers'], recording['body'])
+
+    def forward(self, method, host, path, query, body, key):
+        headers = {name: self.headers[name] for name in FORWARDED_HEADERS if name in self.headers}
+        url = f'https://{host}{path}' + (f'?{query}' if query else '')
+        response = requests.request(method, url, data=body or None, headers=headers)
+
+        # rate-limited or failing upstream responses are passed on but not recorded
+        recorded_headers = {name: response.headers[name] for name in RECORDED_HEADERS if name in response.headers}
+        if response.status_code in (429, 503):
+            return {'status': response.status_code, 'headers': recorded_headers, 'body': b''}
+
+        self.server.recordings.save(host, key, response.status_code, recorded_headers, response.content)
+        return {'status': response.status_code, 'headers': recorded_headers, 'body': response.content}
+
+    def respond(self, status, headers, body):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+
+def make_server(port=0, recordings=None, behaviour=None, record=False):
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    server.daemon_threads = True
+    server.recordings = recordings or Recordings()
+    server.behaviour = behaviour or Behaviour()
+    server.record = record
+    return server
+
+
+# runs the server in a background thread and returns it, server.server_address has the port
+def start_server(**kwargs):
+    server = make_server(**kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
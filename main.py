@@ -1,4 +1,32 @@
+import argparse
 from modules import collector
 
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Collects game data. Without arguments, runs the full update.')
+    parser.add_argument('--sources', nargs='+', metavar='SOURCE',
+                        help='refresh only these sources: steam, rating, steamspy, prices, players, igdb')
+    parser.add_argument('--appids', nargs='+', type=int, default=[], metavar='APPID',
+                        help='refresh only these appids')
+    parser.add_argument('--appids-file', metavar='PATH',
+                        help='refresh only the appids listed in this file, separated by whitespace or commas')
+    parser.add_argument('--query', metavar='QUERY',
+                        help="refresh only the appids matching this query over the saved summary_df, "
+                             "e.g. 'reviews_total >= 1000'")
+    parser.add_argument('--max-workers', type=int, default=8, help='number of stages running at the same time')
+    return parser, parser.parse_args()
+
+
 if __name__ == '__main__':
-    collector.update_data()
+    parser, args = parse_args()
+    selective = args.sources or args.appids or args.appids_file or args.query
+
+    if not selective:
+        collector.update_data(args.max_workers)
+    else:
+        appids = collector.select_appids(args.appids, args.appids_file, args.query)
+        if not appids:
+            parser.error('no appids to refresh, pass --appids, --appids-file or --query')
+        sources = args.sources or collector.registry.SOURCES
+        print(f'refreshing {", ".join(sources)} for {len(appids)} appids')
+        collector.refresh(sources, appids, args.max_workers)
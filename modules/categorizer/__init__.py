@@ -0,0 +1,168 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from modules.collector import DATA_PATH
+from modules.categorizer.rules import RULES
+from utilities import misc, savior
+
+# the tables the categories are derived from, all of them appid plus one column per tag, genre or keyword
+SOURCES = {'tags': 'tags_df', 'steam_genres': 'steam_genres_df', 'keywords': 'keywords_df'}
+KINDS = ['gameplay', 'theme', 'visual']
+
+# an app gets a category once the weighted sum of its features reaches MIN_SCORE (see modules.categorizer.rules)
+MIN_SCORE = 1.0
+
+
+def get_table_name(kind):
+    return f'{kind}_categories_df'
+
+
+# the rules are compiled once into a list of (kind, category) columns and an inverted index
+# source -> feature -> [(column, weight)], so a feature used by many categories is looked up only once
+def compile_rules(rules=RULES):
+    categories = []
+    index = {source: {} for source in SOURCES}
+    for kind in KINDS:
+        for category, sources in rules.get(kind, {}).items():
+            column = len(categories)
+            categories.append((kind, category))
+            for source, weights in sources.items():
+                if source not in SOURCES:
+                    raise ValueError(f'unknown source {source} in the rule of {kind} category {category}')
+                for feature, weight in weights.items():
+                    index[source].setdefault(misc.format_column_name(feature), []).append((column, weight))
+
+    return categories, index
+
+
+# features x categories weights of one source, rows in the order of its vocabulary
+# features no rule mentions get empty rows, so their columns add nothing to the product
+def get_weight_matrix(entries, vocabulary, size):
+    positions = {misc.format_column_name(feature): i for i, feature in enumerate(vocabulary)}
+    rows, columns, weights = [], [], []
+    for feature, targets in entries.items():
+        if feature not in positions:
+            continue
+        for column, weight in targets:
+            rows.append(positions[feature])
+            columns.append(column)
+            weights.append(weight)
+
+    return sparse.csr_matrix((np.array(weights, dtype='float32'), (rows, columns)), shape=(len(vocabulary), size))
+
+
+# (appids, vocabulary, CSR matrix) of a saved source table, only the given appids are read from Parquet and Arrow
+def load_parts(name, appids=None, path=DATA_PATH):
+    found = savior.find(path + name)
+    if found is None:
+        return None
+    if found.endswith('.npz'):
+        return savior.load_sparse_parts(found)
+    return misc.get_sparse_parts(savior.load(found, appids=appids))
+
+
+# the rows of a source matrix moved to the positions of their appids in appids, apps the source lacks get empty rows
+def align_rows(parts, appids):
+    source_appids, _, matrix = parts
+    positions = pd.Index(appids).get_indexer(source_appids)
+    matrix = matrix.tocoo()
+    rows = positions[matrix.row]
+    kept = rows >= 0
+
+    return sparse.csr_matrix((matrix.data[kept].astype('float32'), (rows[kept], matrix.col[kept])),
+                             shape=(len(appids), matrix.shape[1]))
+
+
+# apps x categories scores of all apps at once: the source matrices side by side times their weights stacked,
+# one sparse product instead of evaluating every rule for every app
+def get_scores(sources, appids, categories, index):
+    features = [align_rows(parts, appids) for parts in sources.values()]
+    weights = [get_weight_matrix(index[source], parts[1], len(categories)) for source, parts in sources.items()]
+    if not features:
+        return sparse.csr_matrix((len(appids), len(categories)), dtype='float32')
+
+    return sparse.hstack(features, format='csr') @ sparse.vstack(weights, format='csr')
+
+
+# one sparse dummy table per kind, appid plus one 0/1 column per category of the kind
+def get_category_tables(scores, appids, categories):
+    scores = scores.tocsr()
+    scores.data = (scores.data >= MIN_SCORE).astype('int8')
+    scores.eliminate_zeros()
+
+    tables = {}
+    for kind in KINDS:
+        columns = [i for i, (category_kind, _) in enumerate(categories) if category_kind == kind]
+        tables[get_table_name(kind)] = misc.from_sparse_parts(appids, [categories[i][1] for i in columns],
+                                                              scores[:, columns])
+    return tables
+
+
+# categories of the given appids (all apps of the sources by default)
+def categorize(appids=None, rules=RULES, path=DATA_PATH):
+    categories, index = compile_rules(rules)
+
+    sources = {}
+    for source, name in SOURCES.items():
+        parts = load_parts(name, appids, path)
+        if parts is not None:
+            sources[source] = parts
+
+    if appids is None:
+        appids = np.unique(np.concatenate([parts[0] for parts in sources.values()] or [[]])).astype('int64')
+    appids = np.asarray(appids, dtype='int64')
+
+    return get_category_tables(get_scores(sources, appids, categories, index), appids, categories)
+
+
+# appids of all apps of the sources, only the appid column is read from Parquet and Arrow
+def get_source_appids(path=DATA_PATH):
+    appids = set()
+    for name in SOURCES.values():
+        found = savior.find(path + name)
+        if found is None:
+            continue
+        if found.endswith('.npz'):
+            appids.update(savior.load_sparse_parts(found)[0])
+        else:
+            appids.update(savior.load(found, columns=['appid'])['appid'])
+    return appids
+
+
+# CSR parts of the saved tables per kind, None if any is missing or its categories are not those of the rules
+def load_saved(categories, path=DATA_PATH):
+    saved = {}
+    for kind in KINDS:
+        found = savior.find(path + get_table_name(kind))
+        if found is None or not found.endswith('.npz'):
+            return None
+        saved[kind] = savior.load_sparse_parts(found)
+        if saved[kind][1] != [category for category_kind, category in categories if category_kind == kind]:
+            return None
+    return saved
+
+
+# categorizes only the apps that have no categories yet (or the given appids, e.g. after their tags were refreshed)
+# and merges them into the saved tables; when there are no saved tables or the rules changed their categories,
+# the whole catalogue is categorized again
+# returns the appids that were categorized
+def update_categories(appids=None, rules=RULES, path=DATA_PATH):
+    categories, _ = compile_rules(rules)
+    saved = load_saved(categories, path)
+
+    if saved is None:
+        tables = categorize(None, rules, path)
+        for name, table in tables.items():
+            savior.save(table, path + name)
+        return list(tables[get_table_name(KINDS[0])]['appid'])
+
+    if appids is None:
+        appids = sorted(get_source_appids(path) - set(saved[KINDS[0]][0]))
+    if not appids:
+        return []
+
+    tables = categorize(appids, rules, path)
+    for kind in KINDS:
+        merged = misc.merge_sparse_parts(saved[kind], misc.get_sparse_parts(tables[get_table_name(kind)]))
+        savior.save(misc.from_sparse_parts(*merged), path + get_table_name(kind))
+    return list(appids)
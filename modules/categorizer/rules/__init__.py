@@ -0,0 +1,112 @@
+# kind -> category -> source -> feature -> weight
+# features are column names of the source tables (see misc.format_column_name), so 'Rogue-like' is rogue_like
+# and "Shoot 'Em Up" is shoot_'em_up
+# an app gets a category once the weighted sum of its features reaches categorizer.MIN_SCORE
+# tags are shares of the votes of the app's top tag (0 to 1), genres and keywords are 0 or 1,
+# so a weight of 1 on a tag means 'the tag is the top one', 2 means 'at least half as voted as the top one'
+# Steam genres are coarse, they only add to the tags (weight below 1), keywords are specific enough on their own
+RULES = {
+    'gameplay': {
+        'action': {'tags': {'action': 1.5, 'hack_and_slash': 2, "beat_'em_up": 2, "shoot_'em_up": 2},
+                   'steam_genres': {'action': 0.5},
+                   'keywords': {"beat_'em_up": 1, 'hack_and_slash': 1}},
+        'shooter': {'tags': {'shooter': 2, 'fps': 2, 'third_person_shooter': 2, "shoot_'em_up": 1.5,
+                             'bullet_hell': 1.5, 'looter_shooter': 2, 'arena_shooter': 2},
+                    'keywords': {'shooter': 1, 'first_person_shooter': 1, 'bullet_hell': 1}},
+        'platformer': {'tags': {'platformer': 2, '2d_platformer': 2, '3d_platformer': 2, 'precision_platformer': 2,
+                                'puzzle_platformer': 2, 'metroidvania': 1.5},
+                       'keywords': {'platformer': 1, 'platform_game': 1}},
+        'fighting': {'tags': {'fighting': 2, '2d_fighter': 2, '3d_fighter': 2, 'martial_arts': 1},
+                     'keywords': {'fighting_game': 1}},
+        'adventure': {'tags': {'adventure': 1.5, 'point_&_click': 2, 'visual_novel': 2, 'walking_simulator': 2,
+                               'interactive_fiction': 2, 'choose_your_own_adventure': 2, 'exploration': 1},
+                      'steam_genres': {'adventure': 0.5},
+                      'keywords': {'point_and_click': 1, 'visual_novel': 1, 'interactive_fiction': 1}},
+        'rpg': {'tags': {'rpg': 2, 'action_rpg': 2, 'jrpg': 2, 'crpg': 2, 'party_based_rpg': 2,
+                         'turn_based_combat': 1, 'character_customization': 0.5, 'loot': 0.5},
+                'steam_genres': {'rpg': 0.5},
+                'keywords': {'role_playing': 1, 'experience_points': 0.5, 'leveling_up': 0.5}},
+        'strategy': {'tags': {'strategy': 1.5, 'rts': 2, 'turn_based_strategy': 2, 'grand_strategy': 2,
+                              '4x': 2, 'tower_defense': 2, 'tactical': 1, 'wargame': 2, 'card_battler': 1},
+                     'steam_genres': {'strategy': 0.5},
+                     'keywords': {'real_time_strategy': 1, 'turn_based_strategy': 1, 'tower_defense': 1}},
+        'simulation': {'tags': {'simulation': 1.5, 'management': 2, 'city_builder': 2, 'building': 1,
+                                'farming_sim': 2, 'life_sim': 2, 'automobile_sim': 2, 'flight': 1.5,
+                                'economy': 1, 'colony_sim': 2},
+                       'steam_genres': {'simulation': 0.5},
+                       'keywords': {'management': 1, 'city_building': 1, 'life_simulation': 1}},
+        'puzzle': {'tags': {'puzzle': 2, 'logic': 1.5, 'match_3': 2, 'hidden_object': 2, 'sokoban': 2,
+                            'puzzle_platformer': 1},
+                   'keywords': {'puzzle': 1, 'logic_puzzle': 1}},
+        'survival': {'tags': {'survival': 2, 'crafting': 1, 'base_building': 1, 'open_world_survival_craft': 2},
+                     'keywords': {'survival': 1, 'crafting': 0.5}},
+        'roguelike': {'tags': {'roguelike': 2, 'rogue_like': 2, 'roguelite': 2, 'rogue_lite': 2,
+                               'action_roguelike': 2, 'traditional_roguelike': 2, 'procedural_generation': 0.5,
+                               'permadeath': 1},
+                      'keywords': {'roguelike': 1, 'roguelite': 1, 'permadeath': 0.5}},
+        'racing': {'tags': {'racing': 2, 'driving': 1.5, 'automobile_sim': 1},
+                   'steam_genres': {'racing': 0.5},
+                   'keywords': {'racing': 1}},
+        'sports': {'tags': {'sports': 2, 'football': 2, 'soccer': 2, 'basketball': 2, 'golf': 2, 'skateboarding': 2},
+                   'steam_genres': {'sports': 0.5},
+                   'keywords': {'sports': 1}},
+        'stealth': {'tags': {'stealth': 2},
+                    'keywords': {'stealth': 1}},
+        'rhythm': {'tags': {'rhythm': 2, 'music': 1},
+                   'keywords': {'rhythm': 1}},
+        'card_game': {'tags': {'card_game': 2, 'deckbuilding': 2, 'card_battler': 2, 'trading_card_game': 2},
+                      'keywords': {'card_game': 1, 'deck_building': 1}},
+        'mmo': {'tags': {'mmorpg': 2, 'massively_multiplayer': 1.5},
+                'steam_genres': {'massively_multiplayer': 1},
+                'keywords': {'mmorpg': 1}},
+    },
+    'theme': {
+        'fantasy': {'tags': {'fantasy': 2, 'dark_fantasy': 2, 'magic': 1, 'dragons': 1.5, 'medieval': 1},
+                    'keywords': {'fantasy': 1, 'magic': 0.5, 'dragon': 0.5}},
+        'sci_fi': {'tags': {'sci_fi': 2, 'space': 1.5, 'futuristic': 1.5, 'aliens': 1.5, 'robots': 1, 'mechs': 1.5,
+                            'space_sim': 2},
+                   'keywords': {'science_fiction': 1, 'space': 0.5, 'aliens': 0.5}},
+        'cyberpunk': {'tags': {'cyberpunk': 2},
+                      'keywords': {'cyberpunk': 1}},
+        'post_apocalyptic': {'tags': {'post_apocalyptic': 2, 'zombies': 1, 'nuclear': 1},
+                             'keywords': {'post_apocalyptic': 1}},
+        'horror': {'tags': {'horror': 2, 'psychological_horror': 2, 'survival_horror': 2, 'gore': 1, 'zombies': 1},
+                   'keywords': {'horror': 1, 'survival_horror': 1}},
+        'historical': {'tags': {'historical': 2, 'medieval': 1, 'world_war_ii': 2, 'world_war_i': 2,
+                                'alternate_history': 1.5, 'cold_war': 2},
+                       'keywords': {'world_war_ii': 1, 'world_war_i': 1, 'historical': 1}},
+        'military': {'tags': {'military': 2, 'war': 1.5, 'world_war_ii': 1},
+                     'keywords': {'military': 1, 'war': 0.5}},
+        'mystery': {'tags': {'mystery': 2, 'detective': 2, 'investigation': 2, 'noir': 1},
+                    'keywords': {'detective': 1, 'murder_mystery': 1}},
+        'nature': {'tags': {'nature': 2, 'animals': 1, 'underwater': 1, 'farming': 1},
+                   'keywords': {'animals': 0.5}},
+        'romance': {'tags': {'romance': 2, 'dating_sim': 2},
+                    'keywords': {'romance': 1, 'dating_sim': 1}},
+        'comedy': {'tags': {'comedy': 2, 'funny': 2, 'parody': 2, 'satire': 2},
+                   'keywords': {'comedy': 1, 'parody': 1}},
+    },
+    'visual': {
+        'pixel_art': {'tags': {'pixel_graphics': 2, 'retro': 0.5, '8_bit_music': 0.5},
+                      'keywords': {'pixel_art': 1}},
+        '2d': {'tags': {'2d': 2, '2d_platformer': 1, '2d_fighter': 1, 'side_scroller': 1, 'top_down': 0.5,
+                        'pixel_graphics': 1, 'hand_drawn': 1},
+               'keywords': {'2d': 1, 'side_scrolling': 1}},
+        '3d': {'tags': {'3d': 2, '3d_platformer': 1, '3d_fighter': 1, 'first_person': 1, 'third_person': 1},
+               'keywords': {'3d': 1}},
+        'isometric': {'tags': {'isometric': 2},
+                      'keywords': {'isometric': 1}},
+        'realistic': {'tags': {'realistic': 2, 'photorealistic': 2},
+                      'keywords': {'realistic': 1}},
+        'stylized': {'tags': {'stylized': 2, 'cartoony': 2, 'cartoon': 2, 'colorful': 1, 'cute': 1},
+                     'keywords': {'cel_shading': 1, 'cartoon': 1}},
+        'anime': {'tags': {'anime': 2, 'visual_novel': 0.5},
+                  'keywords': {'anime': 1}},
+        'hand_drawn': {'tags': {'hand_drawn': 2, 'beautiful': 0.5},
+                       'keywords': {'hand_drawn': 1}},
+        'low_poly': {'tags': {'low_poly': 2, 'voxel': 1.5},
+                     'keywords': {'low_poly': 1, 'voxel': 1}},
+        'minimalist': {'tags': {'minimalist': 2, 'abstract': 1.5},
+                       'keywords': {'minimalism': 1}},
+    },
+}
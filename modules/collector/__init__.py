@@ -1,148 +1,155 @@
-import os
-import numpy as np
-from varname.helpers import Wrapper
-from modules.collector import steam_data, igdb_data, steamspy_data, prices_data, players_data
-from utilities import savior
+import importlib
 
 DATA_PATH = 'data/'
 
-
-def update_data():
-
-    # STEAM DATA
-    print('fetching appids')
-
-    old_appids = []
-    if os.path.exists(DATA_PATH+'summary_df.pkl'):
-        old_appids = list(savior.load(DATA_PATH+'all_appids.pkl'))
-
-    # use only new appids for Steam data and IGDB data (except critic scores)
-    # use all appids for prices, players, SteamSpy
-
-    # I do not use these appids during testing not to waste extra time
-    all_apps = steam_data.get_all_apps()
-    all_appids = list(all_apps['appid'])
-
-    new_appids = []
-    for x in all_appids:
-        if not (x in old_appids):
-            new_appids.append(x)
-
-    appids_test_1 = [620, 730, 424141343, 216938]
-    appids_test_2 = [620, 630, 14850]
-    appids_test_3 = []
-    appids_test_4 = [620]
-
-    steam_df_raw = steam_data.get_basic_info(new_appids)
-    steam_df = steam_data.clean_basic_info_df(steam_df_raw)
-    images_df = steam_data.get_images_df(steam_df)
-    languages_df = steam_data.get_languages_df(steam_df)
-    categories_df = steam_data.get_categories_df(steam_df)
-    steam_genres_df = steam_data.get_genres_df(steam_df)
-    dlc_df = steam_data.get_dlc_df(steam_df)
-    packages_df = steam_data.get_packages_df(steam_df)
-    content_descriptors_df = steam_data.get_content_descriptors_df(steam_df)
-    requirements_minimum_df = steam_data.get_requirements_minimum_df(steam_df)
-    requirements_recommended_df = steam_data.get_requirements_recommended_df(steam_df)
-    descriptions_df = steam_data.get_descriptions_df(steam_df)
-
-    appids = list(steam_df.query('coming_soon == False')['appid'])
-
-    # SteamSpy API is faster than rating endpoint of Steam API, and it provides similar data
-    # But it lacks user score and score rank – they are always blank for some reason
-    # I can reverse engineer Steam user score formula or calculate SteamDB score instead
-    # (I think Steam score formula is the number of positive reviews divided by negative, but I'm not sure)
-    # It will make data collector faster but more vulnerable for errors on the SteamSpy side
-    # But for now, I keep this
-    # TODO: reverse-engineer Steam score formula
-    rating_df = steam_data.get_rating_df(appids)
-    summary_df = steam_df.merge(rating_df[['appid', 'reviews_total']])
-    summary_df = summary_df.drop(['header_image', 'background', 'screenshots', 'movies', 'dlc', 'categories', 'genres',
-                                  'languages', 'packages', 'content_descriptors_ids', 'content_descriptors_notes',
-                                  'pc_requirements_minimum', 'pc_requirements_recommended', 'metacritic_score',
-                                  'metacritic_url', 'detailed_description', 'about_the_game', 'short_description'],
-                                 errors='ignore', axis=1)
-
-    appids_filter_1 = list(summary_df.query('reviews_total >= 10')['appid'])
-
-    # STEAMSPY
-    steam_spy_df_raw = steamspy_data.get_steamspy_df(all_appids)
-    steam_spy_df = steamspy_data.clean_steam_spy_df(steam_spy_df_raw)
-
-    playtime_df = steamspy_data.get_playtime_df(steam_spy_df)
-    tags_df_raw = steamspy_data.get_tags_df(steam_spy_df_raw)
-    tags_df = steamspy_data.normalize_tags_df(tags_df_raw)
-
-    # CONCURRENT PLAYERS
-    release_dates = [summary_df[summary_df['appid'] == appid]['release_date'].iloc[0] if appid in list(
-        summary_df['appid']) else np.nan for appid in appids_filter_1]
-    player_stats_dict = players_data.get_all_player_stats(appids_filter_1, release_dates)
-    player_info_df = players_data.get_player_info_df(player_stats_dict)
-
-    # PRICES
-    price_stats_dict = prices_data.get_all_prices(all_appids)
-    price_info_df = prices_data.get_price_info_df(price_stats_dict)
-    summary_df = summary_df.merge(price_info_df, on='appid')
-
-    # OWNERS AND REVENUE
-    summary_df['owners'] = steam_data.get_owners(summary_df)
-    summary_df['revenue'] = steam_data.get_revenue(summary_df)
-
-    # IGDB
-    appid_to_igdbid = igdb_data.get_igdb_ids(new_appids)
-    igdb_info_df_raw = igdb_data.get_igdb_info(appid_to_igdbid['igdbid'])
-    igdb_info_df = igdb_data.clean_igdb_info(igdb_info_df_raw, appid_to_igdbid)
-
-    # TODO: add condition, check if there are collection and franchise columns in new data, and merge after that
-    # TODO: or forcibly add collection and franchise columns if there are none
-    summary_df = summary_df.merge(igdb_info_df[['appid', 'age_rating', 'game_engine', 'collection', 'is_collection']])
-
-    platforms_df = igdb_data.get_platforms_df(igdb_info_df, summary_df)
-    igdb_genres_df = igdb_data.get_genres_df(igdb_info_df)
-    themes_df = igdb_data.get_themes_df(igdb_info_df)
-    game_modes_df = igdb_data.get_game_modes_df(igdb_info_df)
-    keywords_df = igdb_data.get_keywords_df(igdb_info_df)
-    player_perspectives_df = igdb_data.get_player_perspectives_df(igdb_info_df)
-
-    rating_df = rating_df.merge(igdb_info_df[['appid', 'critic_score', 'critic_reviews_total']])
-
-    # all_appids = old_appids + new_appids
-
-    # ugly part needed to save variables under their names
-    # wrapping the variables in a for loop does not work – both with 'for x in lst' and 'for i in range(len(lst))'
-    # TODO: think again how to de-hardcode this part
-    all_appids = Wrapper(all_appids)
-    summary_df = Wrapper(summary_df)
-    rating_df = Wrapper(rating_df)
-    images_df = Wrapper(images_df)
-    languages_df = Wrapper(languages_df)
-    categories_df = Wrapper(categories_df)
-    dlc_df = Wrapper(dlc_df)
-    packages_df = Wrapper(packages_df)
-    content_descriptors_df = Wrapper(content_descriptors_df)
-    requirements_minimum_df = Wrapper(requirements_minimum_df)
-    requirements_recommended_df = Wrapper(requirements_recommended_df)
-    descriptions_df = Wrapper(descriptions_df)
-    playtime_df = Wrapper(playtime_df)
-    tags_df = Wrapper(tags_df)
-    player_stats_dict = Wrapper(player_stats_dict)
-    price_stats_dict = Wrapper(price_stats_dict)
-    player_info_df = Wrapper(player_info_df)
-    price_info_df = Wrapper(price_info_df)
-    appid_to_igdbid = Wrapper(appid_to_igdbid)
-    platforms_df = Wrapper(platforms_df)
-    steam_genres_df = Wrapper(steam_genres_df)
-    igdb_genres_df = Wrapper(igdb_genres_df)
-    themes_df = Wrapper(themes_df)
-    game_modes_df = Wrapper(game_modes_df)
-    keywords_df = Wrapper(keywords_df)
-    player_perspectives_df = Wrapper(player_perspectives_df)
-
-    to_save = [all_appids, summary_df, rating_df, images_df, languages_df, categories_df, dlc_df, packages_df,
-               content_descriptors_df, requirements_minimum_df, requirements_recommended_df, descriptions_df,
-               playtime_df, tags_df, player_stats_dict, price_stats_dict, player_info_df, price_info_df,
-               appid_to_igdbid, platforms_df, steam_genres_df, igdb_genres_df, themes_df, game_modes_df, keywords_df,
-               player_perspectives_df]
-
-    for x in to_save:
-        savior.save(x, DATA_PATH + x.name)
+# the submodules (and pandas, bs4, tqdm, requests behind them) are imported on first use
+# so importing the collector costs nothing until data is actually collected
+SUBMODULES = ['steam_data', 'igdb_data', 'steamspy_data', 'prices_data', 'players_data', 'requirements', 'registry',
+              'stages']
+
+# a selective refresh keeps its own checkpoints, so it never resumes from or clears those of a full update
+REFRESH_CHECKPOINT_PATH = 'data/checkpoints/refresh/'
+
+# DataFrames are saved as Parquet, so downstream modules can load only the columns and appids they need
+# dicts, lists and tables pyarrow cannot convert are pickled
+TABLE_FORMAT = 'parquet'
+
+
+def __getattr__(name):
+    if name in SUBMODULES:
+        return importlib.import_module(f'{__name__}.{name}')
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def load_previous(name):
+    from utilities import savior
+
+    path = savior.find(DATA_PATH + name)
+    if path is not None:
+        return savior.load(path)
+    return None
+
+
+# a run fetches only some apps (new ones, due ones), so every table is merged into the saved one by appid
+# and dicts by key; all_appids and the registry (indexed by appid, it covers every known app) replace the saved ones
+# a saved table without appids (from before it had them) cannot be merged, so it is replaced
+def merge_with_saved(name, variable):
+    import pandas as pd
+    from modules.collector import stages
+    from utilities import misc, schema
+
+    if isinstance(variable, dict):
+        return {**(load_previous(name) or {}), **variable}
+    if not isinstance(variable, pd.DataFrame) or variable.index.name == 'appid':
+        return variable
+    if 'appid' not in variable.columns:
+        raise ValueError(f'{name} has no appid column to merge it into the saved table by')
+    if name in stages.SAVED_COLUMNS:
+        variable = variable[[column for column in stages.SAVED_COLUMNS[name] if column in variable.columns]]
+
+    previous = load_previous(name)
+    if previous is not None and 'appid' not in previous.columns:
+        print(f'saved {name} has no appid column, it is replaced')
+        previous = None
+    if previous is not None and name in stages.MIGRATIONS:
+        previous = stages.MIGRATIONS[name](previous)
+    merged = misc.merge_by_appid(previous, variable)
+    if name in stages.ZERO_FILLED:
+        merged = merged.fillna(0)
+    if name in stages.SCHEMAS:
+        merged = schema.apply(merged, stages.SCHEMAS[name])
+    return merged
+
+
+# stages run as a dependency graph (see modules.collector.stages), independent sources are fetched concurrently
+# every fetch stage streams its results into data/checkpoints/<stage>/ as they arrive
+# and every finished stage caches its outputs, so a rerun after a crash skips the stages whose inputs did not change
+# the checkpoints and cached outputs are removed once all tables are saved
+# request, rate limiting and stage metrics of the run are saved to data/metrics/ (see utilities.metrics), even if it fails
+def update_data(max_workers=8):
+    from modules.collector import stages, registry
+    from utilities import savior, checkpoint, dag, metrics
+
+    metrics.reset()
+    try:
+        results = dag.run(stages.STAGES, max_workers, dag.StageCache())
+    finally:
+        metrics.save()
+
+    registry_df = registry.record_counter(results['registry_df'], results['steamspy_reviews'])
+    for source in registry.SOURCES:
+        registry_df = registry.mark_fetched(registry_df, source, results[f'fetched_{source}'])
+
+    for name in stages.TO_SAVE:
+        savior.save(merge_with_saved(name, results[name]), DATA_PATH + name, TABLE_FORMAT, stages.SCHEMAS.get(name))
+
+    checkpoint.clear_all()
+
+
+# appids given directly, listed in a file (separated by whitespace or commas) and matching a query over the saved
+# summary_df, e.g. 'reviews_total >= 1000', in this order and without duplicates
+def select_appids(appids=None, path=None, query=None):
+    from utilities import savior
+
+    selected = list(appids or [])
+    if path is not None:
+        text = savior.load_txt(path, to_list=False)
+        selected += [int(x) for x in text.replace(',', ' ').split()]
+    if query is not None:
+        summary_df = load_previous('summary_df')
+        if summary_df is None:
+            raise ValueError('there is no saved summary_df to query, run the full update first')
+        selected += list(summary_df.query(query)['appid'])
+
+    return list(dict.fromkeys(selected))
+
+
+# refreshes only the given sources for only the given appids and merges the results into the saved tables
+# rating_df is rebuilt along with ratings or IGDB, summary_df is derived from all sources and rebuilt by update_data only
+def refresh(sources, appids, max_workers=8):
+    from modules.collector import stages, registry
+    from utilities import savior, checkpoint, dag, metrics
+
+    unknown = [source for source in sources if source not in registry.SOURCES]
+    if unknown:
+        raise ValueError(f'unknown sources {unknown}, choose from {registry.SOURCES}')
+
+    selected = [stage for stage in stages.STAGES if stage.name in sources or
+                any(source in sources for source in stages.DERIVED_STAGES.get(stage.name, []))]
+    produced = {x for stage in selected for x in stage.outputs}
+
+    saved_registry_df = registry.load_registry(DATA_PATH + 'registry_df')
+    values = {'registry_df': registry.isolate_appids(saved_registry_df, appids),
+              'all_appids': appids,
+              'previous_release_dates': None,
+              'previous_reviews': None}
+    for name, saved_name in stages.SAVED_INPUTS.items():
+        if name not in produced and any(name in stage.inputs for stage in selected):
+            values[name] = load_previous(saved_name)
+            if values[name] is None:
+                raise ValueError(f'there is no saved {saved_name} to refresh {sources} with, run the full update first')
+    for name in stages.OPTIONAL_INPUTS:
+        if name not in produced:
+            values[name] = None
+
+    full_update_path = checkpoint.CHECKPOINT_PATH
+    checkpoint.CHECKPOINT_PATH = REFRESH_CHECKPOINT_PATH
+    metrics.reset()
+    try:
+        results = dag.run(selected, max_workers, values=values)
+    finally:
+        checkpoint.CHECKPOINT_PATH = full_update_path
+        metrics.save()
+
+    for name in stages.TO_SAVE:
+        if name in produced:
+            savior.save(merge_with_saved(name, results[name]), DATA_PATH + name, TABLE_FORMAT,
+                        stages.SCHEMAS.get(name))
+
+    registry_df, _ = registry.register_appids(saved_registry_df, appids)
+    registry_df = registry.record_counter(registry_df, results['steamspy_reviews'])
+    for source in sources:
+        registry_df = registry.mark_fetched(registry_df, source, results[f'fetched_{source}'])
+    savior.save(registry_df, DATA_PATH + 'registry_df', TABLE_FORMAT)
+
+    checkpoint.clear_all(REFRESH_CHECKPOINT_PATH)
@@ -1,99 +1,161 @@
+import os
+import json
 import pandas as pd
 import numpy as np
-import requests
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from tqdm import tqdm
-from utilities import misc
+from utilities import misc, client, metrics, schema
+from utilities.schema import TEXT, OTHER
 
 
 # AUTHORIZATION
-def get_access_token(client_id, client_secret):
-    auth_response = requests.post(AUTH_REQUEST.format(client_id, client_secret))
-    token = auth_response.json()['access_token']
-    return token
+# nothing is read or requested at import: credentials are read and the token is requested on the first IGDB call
+# the token is cached on disk until shortly before it expires, and refreshed when IGDB rejects it
+SECRETS_PATH = 'secrets.txt'
+TOKEN_PATH = 'data/igdb_token.json'
+AUTH_REQUEST = 'https://id.twitch.tv/oauth2/token?client_id={}&client_secret={}&grant_type=client_credentials'
+TOKEN_EXPIRY_MARGIN = 300
 
+auth = None
+auth_lock = threading.Lock()
 
-with open('secrets.txt') as f:
-    secrets = f.readlines()
 
-client_id = secrets[0]
-client_secret = secrets[1]
-AUTH_REQUEST = f'https://id.twitch.tv/oauth2/token?client_id={client_id}&client_secret={client_secret}&grant_type=client_credentials'
-access_token = get_access_token(client_id, client_secret)
-AUTH = {"Client-ID": f"{client_id}", "Authorization": f"Bearer {access_token}"}
+def get_access_token(client_id, client_secret):
+    auth_response = client.post(AUTH_REQUEST.format(client_id, client_secret))
+    auth_response = auth_response.json()
+    return auth_response['access_token'], time.time() + auth_response['expires_in']
 
-# IGDB API ENDPOINTS
-BRIDGE_ENDPOINT = 'https://api.igdb.com/v4/external_games'
-IGDB_INFO_ENDPOINT = 'https://api.igdb.com/v4/games'
 
+def load_cached_token(client_id):
+    if not os.path.exists(TOKEN_PATH):
+        return None
+    with open(TOKEN_PATH) as f:
+        cached = json.load(f)
+    if cached['client_id'] != client_id or cached['expires_at'] - TOKEN_EXPIRY_MARGIN < time.time():
+        return None
+    return cached
 
-def send_igdb_request(endpoint, request_data, ids_to_get, function_desc='collecting IGDB data'):
-    function_desc = function_desc
-    limit = 500
-    end = 0
-    responses = []
 
-    pbar = tqdm(total=len(ids_to_get) // limit + 1, desc=function_desc.upper())
-    count = 0
+def get_auth(refresh=False):
+    global auth
+    with auth_lock:
+        if auth is None or refresh or auth['expires_at'] - TOKEN_EXPIRY_MARGIN < time.time():
+            with open(SECRETS_PATH) as f:
+                client_id, client_secret = [x.strip() for x in f.readlines()[:2]]
 
-    while end < len(ids_to_get):
-        start, end = end, end + limit
-        ids = ','.join(str(e) for e in ids_to_get[start:end])
+            cached = None if refresh else load_cached_token(client_id)
+            if cached is None:
+                access_token, expires_at = get_access_token(client_id, client_secret)
+                cached = {'client_id': client_id, 'access_token': access_token, 'expires_at': expires_at}
+                if os.path.dirname(TOKEN_PATH) and not os.path.exists(os.path.dirname(TOKEN_PATH)):
+                    os.makedirs(os.path.dirname(TOKEN_PATH))
+                with open(TOKEN_PATH, 'w') as f:
+                    json.dump(cached, f)
+            auth = cached
 
-        response = requests.post(endpoint, data=request_data.format(ids, limit), headers=AUTH)
-        response_formatted = pd.json_normalize(response.json())
+        return {"Client-ID": auth['client_id'], "Authorization": f"Bearer {auth['access_token']}"}
 
-        responses.append(response_formatted)
-        count += 1
-        pbar.update(count)
+
+# IGDB API ENDPOINTS
+BRIDGE_ENDPOINT = 'https://api.igdb.com/v4/external_games'
+IGDB_INFO_ENDPOINT = 'https://api.igdb.com/v4/games'
+MULTIQUERY_ENDPOINT = 'https://api.igdb.com/v4/multiquery'
+
+# IGDB allows 4 requests per second and 8 open requests, a multiquery request packs up to 10 queries
+CHUNK_SIZE = 500
+QUERIES_PER_REQUEST = 10
+MAX_IN_FLIGHT = 8
+
+# columns of the responses, also when there are no ids to get (fields missing from every game are filled with NaN)
+IGDB_IDS_COLUMNS = ['id', 'game', 'uid', 'name']
+IGDB_INFO_COLUMNS = ['id', 'name', 'age_ratings', 'collection', 'franchise', 'game_modes', 'game_engines', 'genres',
+                     'keywords', 'multiplayer_modes', 'platforms', 'player_perspectives', 'themes', 'aggregated_rating',
+                     'aggregated_rating_count']
+
+
+def get_multiquery_body(endpoint, request_data, queries):
+    return '\n'.join(f'query {endpoint.split("/")[-1]} "{name}" {{ {request_data.format(ids, CHUNK_SIZE)} '
+                     f'offset {offset}; }};' for name, ids, offset in queries)
+
+
+# 429 and 503 are retried by the client (IGDB rate is set in client.HOST_RATES), a rejected token is renewed once
+def post_multiquery(body):
+    response = client.post(MULTIQUERY_ENDPOINT, data=body, headers=get_auth())
+    if response.status_code == 401:
+        response = client.post(MULTIQUERY_ENDPOINT, data=body, headers=get_auth(refresh=True))
+    client.raise_for_status(response.status_code)
+    return response.json()
+
+
+# ids are split into chunks of CHUNK_SIZE, every chunk is one sub-query of a multiquery request
+# up to MAX_IN_FLIGHT requests run at once; a chunk that fills a whole page gets its next page (offset) queued
+# pages are stitched back per chunk and chunks keep the order of ids
+# checkpoints are kept per chunk, keyed by the ids of the chunk
+def send_igdb_request(endpoint, request_data, ids_to_get, columns, function_desc='collecting IGDB data',
+                      checkpoint=None):
+    ids_to_get = list(ids_to_get)
+    chunks = [','.join(str(e) for e in ids_to_get[i:i + CHUNK_SIZE]) for i in range(0, len(ids_to_get), CHUNK_SIZE)]
+    pages = {i: [] for i in range(len(chunks))}
+    pending = deque((f'{i}_0', ids, 0) for i, ids in enumerate(chunks)
+                    if checkpoint is None or not checkpoint.is_done(ids))
+
+    pbar = tqdm(total=len(chunks), initial=len(chunks) - len(pending), desc=function_desc.upper())
+    in_flight = set()
+    post = metrics.track_cpu(post_multiquery)
+
+    try:
+        with ThreadPoolExecutor(max_workers=MAX_IN_FLIGHT) as executor:
+            while pending or in_flight:
+                while pending and len(in_flight) < MAX_IN_FLIGHT:
+                    queries = [pending.popleft() for _ in range(min(QUERIES_PER_REQUEST, len(pending)))]
+                    body = get_multiquery_body(endpoint, request_data, queries)
+                    in_flight.add(executor.submit(post, body))
+
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for query in future.result():
+                        i, offset = [int(x) for x in query['name'].split('_')]
+                        pages[i].append(pd.json_normalize(query['result']))
+
+                        if len(query['result']) == CHUNK_SIZE:
+                            pending.append((f'{i}_{offset + CHUNK_SIZE}', chunks[i], offset + CHUNK_SIZE))
+                        else:
+                            if checkpoint is not None:
+                                checkpoint.add(chunks[i], pd.concat(pages[i]))
+                            pbar.update(1)
+    finally:
+        if checkpoint is not None:
+            checkpoint.flush()
 
     pbar.close()
 
-    result = pd.concat(responses)
-    return result
+    if checkpoint is not None:
+        responses = checkpoint.results(chunks)
+    else:
+        responses = [pd.concat(pages[i]) for i in range(len(chunks)) if pages[i]]
+    result = pd.concat([pd.DataFrame(columns=columns)] + list(responses))
+    return result.reset_index(drop=True)
 
 
-def get_igdb_ids(appids):
+def get_igdb_ids(appids, checkpoint=None):
     raw_data = '''
         fields game, uid, name; 
         where category=1 & uid=({});
         limit {};'''
 
-    result = send_igdb_request(BRIDGE_ENDPOINT, raw_data, appids, function_desc='collection IGDB ids')
+    result = send_igdb_request(BRIDGE_ENDPOINT, raw_data, appids, IGDB_IDS_COLUMNS,
+                               function_desc='collection IGDB ids', checkpoint=checkpoint)
 
     result = result.drop('id', axis=1)
     result = result.rename(columns={'uid': 'appid', 'game': 'igdbid'})
     result = result.reindex(['appid', 'igdbid', 'name'], axis="columns")
-    result['appid'] = result['appid'].astype(int)
-    return result
-
+    return schema.apply(result.reset_index(drop=True), IGDB_IDS_DTYPES)
 
-def get_age_rating(rating_ids):
-    result = []
-    allowed_ratings = list(np.arange(12) + 1)
 
-    if type(rating_ids) != float:
-        for rating_id in rating_ids:
-            if rating_id in allowed_ratings:
-                result.append(rating_id)
-    else:
-        return np.nan
-
-    if len(result) > 0:
-        if result[0] == 1 or result[0] == 7:
-            return 3
-        if result[0] == 2 or result[0] == 8 or result[0] == 9:
-            return 7
-        if result[0] == 3 or result[0] == 10:
-            return 12
-        if result[0] == 4 or result[0] == 11:
-            return 16
-        if result[0] == 5 or result[0] == 12:
-            return 18
-    else:
-        return np.nan
-
-
-def get_igdb_info(igdbids):
+def get_igdb_info(igdbids, checkpoint=None):
     raw_data = '''
         fields 
             name, 
@@ -115,7 +177,7 @@ def get_igdb_info(igdbids):
         limit
             {};'''
 
-    result = send_igdb_request(IGDB_INFO_ENDPOINT, raw_data, igdbids)
+    result = send_igdb_request(IGDB_INFO_ENDPOINT, raw_data, igdbids, IGDB_INFO_COLUMNS, checkpoint=checkpoint)
 
     return result
 
@@ -172,36 +234,56 @@ game_engines_to_ban = [
 ]
 
 
+# compiled once: alias -> canonical engine name, banned engines as a set, IGDB rating id -> age
+GAME_ENGINE_ALIASES = {alias: engine for engine, aliases in game_engine_variants.items() for alias in aliases}
+GAME_ENGINES_TO_BAN = set(game_engines_to_ban)
+AGE_RATINGS = {1: 3, 7: 3, 2: 7, 8: 7, 9: 7, 3: 12, 10: 12, 4: 16, 11: 16, 5: 18, 12: 18}
+
+# schemas of the cleaned tables (see utilities.schema), lists of genres, keywords, etc. stay Python objects
+# age ratings are ages (3 to 18), so they are numbers rather than categories
+IGDB_IDS_DTYPES = {'appid': 'int32', 'igdbid': 'int32', 'name': TEXT}
+IGDB_INFO_DTYPES = {'appid': 'int32', 'name': TEXT, 'age_rating': 'Int32', 'game_engine': 'category',
+                    'collection': 'Int32', 'franchise': 'Int32', 'critic_score': 'float32',
+                    'critic_reviews_total': 'Int32', 'is_collection': 'bool', 'is_franchise': 'bool'}
+PLATFORMS_DTYPES = {'appid': 'int32', OTHER: 'int8'}
+
+
+# one row per (game, element) with the value of dict_key, indexed by the row of the game
+def explode_dict_series(series, dict_key):
+    exploded = series.explode().dropna()
+    return pd.Series([x[dict_key] for x in exploded], index=exploded.index, dtype=object)
+
+
 def clean_igdb_info(df, id_conversion_table):
-    df = df.copy()
+    df = df.reset_index(drop=True)
     columns_to_format = ['age_ratings', 'game_engines', 'game_modes',
                          'genres', 'keywords', 'platforms', 'themes']
 
+    values = {}
     for col in columns_to_format:
-        if col == 'age_ratings':
-            key = 'rating'
-        else:
-            key = 'name'
-        df[col] = misc.extract_from_dict_series(df[col], key)
-        df[col] = [misc.empty_to_nan(x) for x in df[col]]
-
-    df['id'] = [id_conversion_table[id_conversion_table['igdbid'] == x]['appid'].iloc[0] for x in df['id']]
+        if col not in df.columns:
+            df[col] = np.nan
+        key = 'rating' if col == 'age_ratings' else 'name'
+        values[col] = explode_dict_series(df[col], key)
+        df[col] = values[col].groupby(level=0).agg(list).reindex(df.index)
+
+    igdbid_to_appid = id_conversion_table.drop_duplicates('igdbid').set_index('igdbid')['appid']
+    df['id'] = df['id'].map(igdbid_to_appid)
     df = df.rename(columns={'id': 'appid',
                             'aggregated_rating': 'critic_score',
                             'aggregated_rating_count': 'critic_reviews_total'})
 
-    df['age_ratings'] = [get_age_rating(x) for x in df['age_ratings']]
+    # the first rating of a known rating system decides the age
+    ratings = values['age_ratings']
+    ratings = ratings[ratings.isin(list(AGE_RATINGS) + [6])]
+    df['age_ratings'] = ratings.groupby(level=0).first().map(AGE_RATINGS).reindex(df.index)
 
-    for i in range(len(df['game_engines'])):
-        if type(df['game_engines'][i]) != float:
-            for j in range(len(df['game_engines'][i])):
-                if df['game_engines'][i][j] in game_engines_to_ban:
-                    df['game_engines'][i].remove(df['game_engines'][i][j])
-                else:
-                    df['game_engines'][i][j] = misc.get_dict_key_by_value(df['game_engines'][i][j],
-                                                                          game_engine_variants)
-
-    df['game_engines'] = [x[0] if type(x) != float else np.nan for x in df['game_engines']]
+    # the first engine that is not banned, under its canonical name
+    engines = values['game_engines']
+    canonical_engines = engines.map(GAME_ENGINE_ALIASES).fillna(engines)
+    canonical_engines = canonical_engines[~engines.isin(GAME_ENGINES_TO_BAN) &
+                                          ~canonical_engines.isin(GAME_ENGINES_TO_BAN)]
+    df['game_engines'] = canonical_engines.groupby(level=0).first().reindex(df.index)
 
     df = df.rename(columns={'game_engines': 'game_engine', 'age_ratings': 'age_rating'})
 
@@ -215,20 +297,21 @@ def clean_igdb_info(df, id_conversion_table):
     else:
         df['is_franchise'] = [False] * len(df)
 
-    return df
+    return schema.apply(df, IGDB_INFO_DTYPES)
 
 
+# one row per app of steam_df, IGDB platforms are matched by appid and Steam decides windows, linux and mac
 def get_platforms_df(df, steam_df):
-    platform_dummies = pd.get_dummies(df['platforms'].apply(pd.Series).stack()).groupby(level=0).sum()
-    result = df[['appid']].join(platform_dummies)
-
-    result = result.rename(columns={'PC (Microsoft Windows)': 'windows'})
-    result.columns = ["_".join(x.lower().split()) for x in result.columns]
+    platforms = df.set_index('appid')['platforms'].explode().dropna()
+    platform_dummies = pd.get_dummies(platforms.replace('PC (Microsoft Windows)', 'windows')).groupby(level=0).max()
+    platform_dummies.columns = ["_".join(x.lower().split()) for x in platform_dummies.columns]
 
-    result = result.fillna(0).astype(int)
+    result = steam_df[['appid']].join(platform_dummies.drop(['windows', 'linux', 'mac'], axis=1, errors='ignore'),
+                                      on='appid')
+    result = result.fillna(0)
     result[['windows', 'linux', 'mac']] = steam_df[['windows', 'linux', 'mac']].astype(int)
 
-    return result
+    return schema.apply(result.reset_index(drop=True), PLATFORMS_DTYPES)
 
 
 def get_player_perspectives_df(df):
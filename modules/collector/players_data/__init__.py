@@ -1,11 +1,8 @@
 import pandas as pd
 import numpy as np
-import requests
-import datetime
 
-from bs4 import BeautifulSoup
-from tqdm import tqdm
 from utilities.exceptions import NotFoundException
+from utilities import client, pool, tables, schema
 pd.options.mode.chained_assignment = None  # default='warn'
 
 PLAYERS_ENDPOINT = 'https://steamplayercount.com/app/{}'
@@ -13,63 +10,81 @@ PLAYERS_ENDPOINT = 'https://steamplayercount.com/app/{}'
 
 def get_player_stats(appid):
     try:
-        response = requests.get(PLAYERS_ENDPOINT.format(appid))
+        return client.get_parsed(PLAYERS_ENDPOINT.format(appid), lambda response: tables.extract_table(response.text))
+    except NotFoundException:
+        return np.nan
 
-        if response.status_code == 404:
-            raise NotFoundException
 
-        soup = BeautifulSoup(response.text, 'html.parser')
+PLAYER_COLUMNS = {'Month': 'month', 'Peak': 'peak', 'Min Daily Peak': 'min_peak', 'Avg Daily Peak': 'mean_peak'}
+PLAYER_DTYPES = {'appid': 'int32', 'month': 'datetime64[ns]', 'peak': 'int32', 'min_peak': 'int32',
+                 'mean_peak': 'int32'}
+PLAYER_INFO_DTYPES = {'appid': 'int32', 'peak_launch': 'Int32', 'peak_year_mean': 'float32'}
 
-        tables = [
-            [
-                [td.get_text(strip=True) for td in tr.find_all(lambda tag: tag.name == 'td' or tag.name == 'th')]
-                for tr in table.find_all('tr')
-            ]
-            for table in soup.find_all(class_='breakdown-table')
-        ]
 
-        result = pd.DataFrame(data=tables[0][1:], columns=tables[0][0])
+# player history of all apps is kept in one long table (appid, month, peak, min_peak, mean_peak)
+# sorted by appid and month, so every summary metric is a grouped operation instead of a loop over apps
+def get_player_stats_long_df(player_tables):
+    df = pd.concat(player_tables, names=['appid', None]).reset_index(level=0)
+    df = df[['appid'] + list(PLAYER_COLUMNS)].rename(columns=PLAYER_COLUMNS)
+    df['month'] = pd.to_datetime(df['month'])
 
-        return result
-    except NotFoundException:
-        return np.nan
+    for col in ['peak', 'min_peak', 'mean_peak']:
+        df[col] = df[col].str.replace(',', '', regex=False)
 
+    return df.astype(PLAYER_DTYPES)
 
-def clean_players_df(df, release_date):
-    df = df[['Month', 'Peak', 'Min Daily Peak', 'Avg Daily Peak']]
-    df['Month'] = pd.to_datetime(df['Month'])
-    df.columns = ['month', 'peak', 'min_peak', 'mean_peak']
 
-    for col in ['peak', 'min_peak', 'mean_peak']:
-        df[col] = [int(x.replace(',', '')) for x in df[col]]
+# months before the release month are dropped, apps with an unknown release date keep all months
+def clean_players_long_df(df, release_dates):
+    release_months = pd.to_datetime(pd.Series(release_dates)).dt.to_period('M').dt.to_timestamp()
+    df = df[~(df['month'] < df['appid'].map(release_months))]
 
-    release_month = datetime.datetime(release_date.year, release_date.month, 1)
-    df = df[df['month'] >= release_month]
+    return df.sort_values(['appid', 'month']).reset_index(drop=True)
 
-    return df.sort_values('month').reset_index(drop=True)
 
+def empty_player_stats_df():
+    return pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in PLAYER_DTYPES.items()})
 
-def get_all_player_stats(appids, release_dates):
+
+# for player stats saved as {appid: df} before the long format
+def player_stats_dict_to_long_df(player_stats):
+    frames = {appid: df for appid, df in player_stats.items() if type(df) != float}
+    if not frames:
+        return empty_player_stats_df()
+
+    df = pd.concat(frames, names=['appid', None]).reset_index(level=0).reset_index(drop=True)
+    return df.astype(PLAYER_DTYPES).sort_values(['appid', 'month']).reset_index(drop=True)
+
+
+# fetching and parsing run in a bounded thread pool, requests per host are capped in utilities.client
+# returns the long table and the appids that were done, apps left undone by the pool (see pool.map_ordered) are not
+def get_all_player_stats(appids, release_dates, max_workers=16, checkpoint=None):
     function_desc = 'collecting player stats'
-    results = {}
+    player_tables = pool.map_ordered(get_player_stats, appids, max_workers, function_desc, checkpoint)
+    done = [appid for appid, x in zip(appids, player_tables) if x is not None]
+    player_tables = {appid: x for appid, x in zip(appids, player_tables) if x is not None and type(x) != float}
+
+    if not player_tables:
+        return empty_player_stats_df(), done
 
-    for appid, release_date in tqdm(zip(appids, release_dates), total=len(appids), desc=function_desc.upper()):
-        temp_players_df = get_player_stats(appid)
-        results[appid] = np.nan
-        if type(temp_players_df) != float:
-            results[appid] = clean_players_df(temp_players_df, release_date)
+    return clean_players_long_df(get_player_stats_long_df(player_tables), dict(zip(appids, release_dates))), done
 
-    return results
 
+# mean of a column over the months [start, end) counted from the first month of every app
+def get_window_mean(player_stats, column, start, end):
+    position = player_stats.groupby('appid').cumcount()
+    window = player_stats[(position >= start) & (position < end)]
+    return window.groupby('appid')[column].mean().round(2)
 
-def get_player_info_df(player_stats):
-    appids = [appid for appid in player_stats]
 
-    peak_launch = [player_stats[appid].iloc[0]['peak'] if type(
-        player_stats[appid]) != float else np.nan for appid in player_stats]
+# apps without player stats get NaN if they are passed in appids
+def get_player_info_df(player_stats, appids=None):
+    peak_launch = player_stats.groupby('appid')['peak'].first()
+    peak_year_mean = get_window_mean(player_stats, 'mean_peak', 1, 12)
 
-    peak_year_mean = [round(player_stats[appid].iloc[1:12]['mean_peak'].mean(), 2) if type(
-        player_stats[appid]) != float else np.nan for appid in player_stats]
+    result = pd.DataFrame({'peak_launch': peak_launch, 'peak_year_mean': peak_year_mean})
+    if appids is not None:
+        result = result.reindex(appids)
 
-    result = pd.DataFrame({'appid': appids, 'peak_launch': peak_launch, 'peak_year_mean': peak_year_mean})
-    return result
+    result.index.name = 'appid'
+    return schema.apply(result.reset_index(), PLAYER_INFO_DTYPES)
@@ -1,96 +1,82 @@
 import pandas as pd
 import numpy as np
-import requests
 import datetime
 
-from bs4 import BeautifulSoup
-from tqdm import tqdm
 from utilities.exceptions import NotFoundException
+from utilities import client, pool, tables, schema
 
 PRICES_ENDPOINT = 'https://steampricehistory.com/app/{}'
 
 MAX_DATE = datetime.datetime.now()
 MAX_DATE = datetime.datetime(MAX_DATE.year, MAX_DATE.month, 1)
 
+PRICE_INFO_DTYPES = {'appid': 'int32', 'mean_price': 'float32'}
+
 
 def get_price_stats(appid):
     try:
-        response = requests.get(PRICES_ENDPOINT.format(appid))
-
-        if response.status_code == 404:
-            raise NotFoundException
-
-        soup = BeautifulSoup(response.text, 'html.parser')
+        return client.get_parsed(PRICES_ENDPOINT.format(appid), lambda response: tables.extract_table(response.text))
+    except NotFoundException:
+        return np.nan
 
-        tables = [
-            [
-                [td.get_text(strip=True) for td in tr.find_all(lambda tag: tag.name == 'td' or tag.name == 'th')]
-                for tr in table.find_all('tr')
-            ]
-            for table in soup.find_all(class_='breakdown-table')
-        ]
 
-        result = pd.DataFrame(data=tables[0][1:], columns=tables[0][0])
+# every function below works on one long table with the price changes of all apps at once (appid, date, price)
+# the rows of an app are kept ordered from the newest date to the oldest
+def get_price_changes_df(price_tables):
+    df = pd.concat(price_tables, names=['appid', None]).reset_index(level=0)
+    df = df[['appid', 'Date', 'Price']].rename(columns={'Date': 'date', 'Price': 'price'})
+    df['appid'] = df['appid'].astype(int)
+    df['date'] = pd.to_datetime(df['date'])
+    df['price'] = df['price'].str.strip('$').astype(float)
 
-        return result
-    except NotFoundException:
-        return np.nan
+    return df.reset_index(drop=True)
 
 
-def get_price_periods(df):
-    periods = []
-    for i in range(len(df['date']) - 1):
-        periods.append((df.iloc[i]['date'] - df.iloc[i + 1]['date']).days)
-    periods.insert(0, (MAX_DATE - df.iloc[0]['date']).days)
-    return periods
+def month_number_to_date(month_numbers):
+    return (np.datetime64('1970-01', 'M') + month_numbers).astype('datetime64[ns]')
 
 
+# first days of the months from the first price change to MAX_DATE, for every app
+# a month counts only if its first day is not earlier than the first price change
 def arange_months(df):
-    result = []
+    min_dates = df.groupby('appid')['date'].min()
+    min_months = min_dates.values.astype('datetime64[M]')
+    first = min_months.astype(int) + (min_months.astype('datetime64[ns]') < min_dates.values)
+    last = (MAX_DATE.year - 1970) * 12 + MAX_DATE.month - 1
+    counts = np.maximum(last - first + 1, 0)
 
-    min_month = df['date'].min()
-    max_month = MAX_DATE
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    result = pd.DataFrame({'appid': np.repeat(min_dates.index.values, counts),
+                           'date': month_number_to_date(np.repeat(first, counts) + offsets)})
 
-    min_year = min_month.year
-    max_year = max_month.year
-
-    years = np.arange(min_year, max_year + 1)
-    months = np.arange(12) + 1
+    return result
 
-    for year in years:
-        for month in months:
-            date = datetime.datetime(year, month, 1)
-            if min_month <= date <= max_month:
-                result.append(date)
 
-    return pd.DataFrame(result[::-1]).rename(columns={0: 'month'})
+# number of days every price was active: until the next newer row of the same app, or until MAX_DATE for the newest
+def get_price_periods(df):
+    next_dates = df.groupby('appid')['date'].shift(1).fillna(MAX_DATE)
+    return (next_dates - df['date']).dt.days
 
 
 def get_weighted_average_price(df):
     df = df[df['period'] != 0]
-    result = df.groupby('month').agg({'price': lambda x: list(x), 'period': lambda x: list(x)}).reset_index()
-    result['average_price'] = [np.average(price, weights=period).round(2) for price, period in zip(
-        result['price'], result['period'])]
+    weighted = df.assign(weighted_price=df['price'] * df['period'])
+    result = weighted.groupby(['appid', 'month'], sort=False)[['weighted_price', 'period']].sum().reset_index()
+    result['average_price'] = (result['weighted_price'] / result['period'].replace(0, np.nan)).round(2)
 
-    return result[['month', 'average_price']]
+    return result[['appid', 'month', 'average_price']]
 
 
-# not optimized: repeating df['month']=... rows
-def clean_price_df(df):
-    df = df.copy()
-    df['Price'] = [float(x.strip('$')) for x in df['Price']]
-    df['Date'] = pd.to_datetime(df['Date'])
-    df = df.drop(['Gain', 'Discount'], axis=1)
-    df.columns = [x.lower() for x in df.columns]
+# the first day of every month gets the price active on that day, so every month is split into exact periods
+def clean_price_long_df(df):
+    change_months = df[['appid']].assign(date=df['date'].values.astype('datetime64[M]').astype('datetime64[ns]'))
+    month_starts = pd.concat([arange_months(df), change_months])
 
-    df['month'] = [datetime.datetime(x.year, x.month, 1) for x in df['date']]
-    df = df.merge(arange_months(df), how='outer')
-    df = pd.DataFrame(df['month'].rename('date')).merge(df, how='outer').drop_duplicates('date')
-    df = df.dropna(subset=['date'])
-    df['month'] = [datetime.datetime(x.year, x.month, 1) for x in df['date']]
-    df = df.sort_values(['month', 'date'], ascending=False)
+    df = pd.concat([df, month_starts]).drop_duplicates(['appid', 'date'])
+    df['month'] = df['date'].values.astype('datetime64[M]').astype('datetime64[ns]')
+    df = df.sort_values(['appid', 'date'], ascending=[True, False])
 
-    df['price'] = df['price'].fillna(method='bfill')
+    df['price'] = df.groupby('appid')['price'].bfill()
     df = df.dropna(subset=['price'])
 
     df['period'] = get_price_periods(df)
@@ -99,23 +85,50 @@ def clean_price_df(df):
     return df.reset_index(drop=True)
 
 
-def get_all_prices(appids):
+# fetching and parsing run in a bounded thread pool, requests per host are capped in utilities.client
+# the monthly averages are then computed for all apps at once
+# apps left undone by the pool (see pool.map_ordered) are not in the result, apps without a history are NaN
+def get_all_prices(appids, max_workers=16, checkpoint=None):
     function_desc = 'collecting prices'
-    results = {}
+    price_tables = pool.map_ordered(get_price_stats, appids, max_workers, function_desc, checkpoint)
+    done = [appid for appid, x in zip(appids, price_tables) if x is not None]
+    price_tables = {appid: x for appid, x in zip(appids, price_tables) if x is not None and type(x) != float}
 
-    for appid in tqdm(appids, desc=function_desc.upper()):
-        temp_price_df = get_price_stats(appid)
-        results[appid] = np.nan
-        if type(temp_price_df) != float:
-            results[appid] = clean_price_df(temp_price_df)
+    results = dict.fromkeys(done, np.nan)
+    if price_tables:
+        prices = clean_price_long_df(get_price_changes_df(price_tables))
+        for appid, price_df in prices.groupby('appid', sort=False):
+            results[appid] = price_df.drop('appid', axis=1).reset_index(drop=True)
 
     return results
 
 
-def get_price_info_df(prices):
+# full history is scraped only for apps we have never scraped and for apps whose current price or discount
+# differs from the previous batched refresh (see steam_data.get_current_prices)
+def get_appids_to_scrape(appids, current_prices, previous_prices=None, prices=None):
+    if prices is None or previous_prices is None:
+        return list(appids)
+
+    columns = ['appid', 'current_price', 'discount_percent']
+    compared = current_prices[columns].merge(previous_prices[columns], on='appid', how='left',
+                                             suffixes=('', '_previous'))
+    changed = compared[(compared['current_price'] != compared['current_price_previous']) |
+                       (compared['discount_percent'] != compared['discount_percent_previous'])]
+    changed = set(changed['appid'])
+
+    return [appid for appid in appids if appid not in prices or appid in changed]
+
+
+# apps without a scraped history fall back to their current price from the batched refresh
+def get_price_info_df(prices, current_prices=None):
     mean_prices = {x: round(prices[x]['average_price'].mean(), 2) if type(
         prices[x]) != float else np.nan for x in prices}
     result = pd.DataFrame.from_dict(mean_prices, orient='index').reset_index()
     result.columns = ['appid', 'mean_price']
 
-    return result
+    if current_prices is not None:
+        result = result.merge(current_prices[['appid', 'current_price']], on='appid', how='outer')
+        result['mean_price'] = result['mean_price'].fillna(result['current_price'])
+        result = result.drop('current_price', axis=1)
+
+    return schema.apply(result, PRICE_INFO_DTYPES)
@@ -0,0 +1,157 @@
+import datetime
+import numpy as np
+import pandas as pd
+from utilities import savior
+
+# the registry keeps one row per known appid and, per source, the time of the last successful fetch
+SOURCES = ['steam', 'rating', 'steamspy', 'prices', 'players', 'igdb']
+
+# it also keeps the latest SteamSpy positive + negative of every app and, for the sources refreshed by expected change,
+# its value when the source was last fetched (a column <source>_steamspy_reviews, see get_expected_change)
+COUNTER = 'steamspy_reviews'
+BASELINES = {'rating': f'rating_{COUNTER}'}
+
+# days after which a source is due again for an app, None means it is fetched only once
+STALENESS = {'steam': None,
+             'rating': 7,
+             'steamspy': 7,
+             'prices': 30,
+             'players': 30,
+             'igdb': None}
+
+# recently released apps change fast, so their staleness is multiplied by the factor of the first matching age
+RELEASE_AGE_FACTORS = [(90, 0.25), (365, 0.5)]
+
+# apps with little activity (e.g. less than 10 reviews) rarely change, so they are refreshed less often
+LOW_ACTIVITY_THRESHOLD = 10
+LOW_ACTIVITY_FACTOR = 4
+
+# sources refreshed by expected change (see get_expected_change) skip apps expected to change less than this share
+# but every app is refetched at least every MAX_STALENESS days; apps without a release date count as DEFAULT_AGE old
+MIN_EXPECTED_CHANGE = 0.01
+MAX_STALENESS = 180
+DEFAULT_AGE = 365
+
+
+def get_dtypes():
+    dtypes = {source: 'datetime64[ns]' for source in SOURCES}
+    dtypes.update({column: 'float64' for column in [COUNTER] + list(BASELINES.values())})
+    return dtypes
+
+
+def empty_registry():
+    registry = pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in get_dtypes().items()})
+    registry.index = pd.Index([], dtype='int64', name='appid')
+    return registry
+
+
+# registries saved before a column existed get it empty
+def load_registry(path):
+    path = savior.find(path)
+    if path is None:
+        return empty_registry()
+
+    registry = savior.load(path)
+    for column, dtype in get_dtypes().items():
+        if column not in registry.columns:
+            registry[column] = pd.Series(dtype=dtype, index=registry.index)
+    return registry
+
+
+# returns the registry with the unknown appids added and the list of those new appids, in the order of appids
+def register_appids(registry, appids):
+    known = set(registry.index)
+    new_appids = [appid for appid in dict.fromkeys(appids) if appid not in known]
+
+    new_rows = pd.DataFrame({column: pd.Series(dtype=registry[column].dtype) for column in registry.columns},
+                            index=pd.Index(new_appids, dtype='int64', name='appid'))
+    registry = pd.concat([registry, new_rows])
+
+    return registry, new_appids
+
+
+# the latest SteamSpy counts of the apps are kept as the baseline of the sources in BASELINES,
+# so record_counter has to come first
+def mark_fetched(registry, source, appids, now=None):
+    now = now or datetime.datetime.now()
+    appids = registry.index.intersection(list(appids))
+    registry.loc[appids, source] = now
+    if source in BASELINES:
+        registry.loc[appids, BASELINES[source]] = registry.loc[appids, COUNTER]
+    return registry
+
+
+# counts is a Series indexed by appid (None when SteamSpy was not fetched), unknown appids are ignored
+def record_counter(registry, counts):
+    if counts is not None:
+        counts = counts[counts.index.isin(registry.index)]
+        registry.loc[counts.index, COUNTER] = counts.astype(float)
+    return registry
+
+
+# a copy of the registry in which only appids are due for every source
+# they count as never fetched, every other app as fetched just now
+def isolate_appids(registry, appids, now=None):
+    now = now or datetime.datetime.now()
+    registry, _ = register_appids(registry, appids)
+    registry.loc[:, SOURCES] = now
+    registry.loc[list(appids), SOURCES] = pd.NaT
+    return registry
+
+
+# expected relative change of the data of a source in BASELINES (e.g. reviews_total) since it was last fetched
+# the larger of two cheap signals:
+# - the change of SteamSpy positive + negative since the last fetch of the source (this run's counts, or the latest
+#   recorded ones, against those recorded at that fetch); apps without a recorded baseline only get the second signal
+# - the time since the last fetch relative to the age of the app, as counters of young apps grow fastest
+# apps never fetched get inf
+# counts (this run's SteamSpy counts) and release_dates are Series indexed by appid
+def get_expected_change(registry, source, appids, counts=None, release_dates=None, now=None):
+    now = now or datetime.datetime.now()
+    appids = pd.Index(list(appids))
+    last_fetched = registry[source].reindex(appids)
+    days = (now - last_fetched).dt.days
+
+    age = pd.Series(float(DEFAULT_AGE), index=appids)
+    if release_dates is not None:
+        age = (now - pd.to_datetime(release_dates.reindex(appids))).dt.days.fillna(DEFAULT_AGE)
+    change = days / age.clip(lower=1)
+
+    latest = registry[COUNTER].reindex(appids)
+    if counts is not None:
+        latest = counts.reindex(appids).astype(float).combine_first(latest)
+    baseline = registry[BASELINES[source]].reindex(appids)
+    difference = (latest - baseline).abs() / (baseline + 1)
+    change = np.maximum(change, difference.fillna(0))
+
+    change[days >= MAX_STALENESS] = np.maximum(change[days >= MAX_STALENESS], MIN_EXPECTED_CHANGE)
+    change[last_fetched.isna()] = np.inf
+    return change.astype(float)
+
+
+# apps expected to change at least min_change, the largest expected change first, at most budget of them
+def prioritize_appids(expected_change, budget=None, min_change=MIN_EXPECTED_CHANGE):
+    change = expected_change[expected_change >= min_change].sort_values(ascending=False, kind='stable')
+    return list(change.index[:budget])
+
+
+# release_dates and activity are Series indexed by appid, apps missing from them get the base staleness
+def get_due_appids(registry, source, appids, release_dates=None, activity=None, now=None):
+    now = now or datetime.datetime.now()
+    appids = pd.Index(list(appids))
+    last_fetched = registry[source].reindex(appids)
+
+    staleness = STALENESS[source]
+    if staleness is None:
+        return list(appids[last_fetched.isna().values])
+
+    days = pd.Series(float(staleness), index=appids)
+    if release_dates is not None:
+        age = (now - pd.to_datetime(release_dates.reindex(appids))).dt.days
+        for max_age, factor in sorted(RELEASE_AGE_FACTORS, reverse=True):
+            days[age <= max_age] = staleness * factor
+    if activity is not None:
+        days[activity.reindex(appids) < LOW_ACTIVITY_THRESHOLD] *= LOW_ACTIVITY_FACTOR
+
+    due = last_fetched.isna() | ((now - last_fetched).dt.days >= days)
+    return list(appids[due.values])
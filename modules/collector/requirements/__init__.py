@@ -0,0 +1,98 @@
+import re
+import numpy as np
+import pandas as pd
+
+# numeric hardware features parsed once from the free-text requirements (see steam_data.get_requirements_df)
+# so the trainer gets typed columns instead of strings like 'Memory: 8 GB RAM'
+HARDWARE_DTYPES = {'ram_gb': 'float32', 'storage_gb': 'float32', 'directx_version': 'float32',
+                   'os_generation': 'Int32', 'cpu_tier': 'Int32', 'gpu_tier': 'Int32'}
+
+# older store pages name storage differently
+STORAGE_KEYS = ['storage', 'hard_drive', 'hard_disk_space', 'hard_disk', 'disk_space']
+
+SIZE_PATTERN = re.compile(r'(\d+(?:[.,]\d+)?)\s*(TB|GB|MB|G|M)\b', re.IGNORECASE)
+SIZE_UNITS = {'tb': 1024, 'gb': 1, 'g': 1, 'mb': 1 / 1024, 'm': 1 / 1024}
+
+DIRECTX_PATTERN = re.compile(r'(\d+(?:\.\d+)?)')
+DIRECTX_IN_TEXT_PATTERN = re.compile(r'directx\s*(\d+(?:\.\d+)?)', re.IGNORECASE)
+
+# the oldest Windows listed is the one required, 'Windows 7/8/10' needs 7
+WINDOWS_PATTERN = re.compile(r'win', re.IGNORECASE)
+OS_VERSION_PATTERN = re.compile(r'\b(xp|vista|11|10|8\.1|8|7)\b', re.IGNORECASE)
+OS_GENERATIONS = {'xp': 5, 'vista': 6, '7': 7, '8': 8, '8.1': 8, '10': 10, '11': 11}
+
+# tiers from 1 (entry level) to 5 (high end), the first matching tier wins, so the higher tiers go first
+# alternatives ('GTX 660 / Radeon HD 7850') are meant to be equivalent, so the higher one is taken
+CPU_TIERS = [(re.compile(r'\bi9\b|ryzen\s*9|threadripper', re.IGNORECASE), 5),
+             (re.compile(r'\bi7\b|ryzen\s*7', re.IGNORECASE), 4),
+             (re.compile(r'\bi5\b|ryzen\s*5|fx[\s-]*[89]\d{3}', re.IGNORECASE), 3),
+             (re.compile(r'\bi3\b|ryzen\s*3|\bfx\b|phenom|quad|athlon\s*ii\s*x4', re.IGNORECASE), 2),
+             (re.compile(r'core\s*2|pentium|celeron|athlon|dual|\bghz\b|intel|amd', re.IGNORECASE), 1)]
+GPU_TIERS = [(re.compile(r'rtx\s*(?:40[6-9]0|30[7-9]0|2080)|rx\s*(?:7[7-9]|6[89])00', re.IGNORECASE), 5),
+             (re.compile(r'rtx\s*\d{4}|gtx\s*10[78]0|rx\s*(?:6[5-7]|5[67])00|vega\s*(?:56|64)', re.IGNORECASE), 4),
+             (re.compile(r'gtx\s*(?:10[56]0|16[56]0|9[78]0)|rx\s*(?:4[78]0|5[78]0|5500)|r9\s*(?:390|fury)',
+                         re.IGNORECASE), 3),
+             (re.compile(r'gtx\s*(?:[67][5-9]0|9[56]0|10[35]0)|rx\s*4[56]0|r9\s*\d{3}|hd\s*7[89]\d0|r7\s*\d{3}',
+                         re.IGNORECASE), 2),
+             (re.compile(r'geforce|gtx|gts|\bgt\s*\d|radeon|\bhd\s*\d|intel|\buhd\b|iris|directx|opengl|vram',
+                         re.IGNORECASE), 1)]
+
+
+def get_column(df, keys):
+    columns = [df[key] for key in keys if key in df.columns]
+    if not columns:
+        return pd.Series(np.nan, index=df.index, dtype=object)
+    result = columns[0]
+    for column in columns[1:]:
+        result = result.fillna(column)
+    return result.astype(object)
+
+
+# requirement texts repeat a lot across apps ('8 GB RAM', 'Version 11'), so every distinct text is parsed only once
+# parse takes a Series of texts and returns a numeric Series of the same length
+def parse_unique(parse, text):
+    codes, uniques = pd.factorize(text)
+    parsed = parse(pd.Series(uniques, dtype=object)).to_numpy(dtype=float)
+    return pd.Series(np.append(parsed, np.nan)[codes], index=text.index)
+
+
+# sizes like '8 GB RAM', '1500 MB available space' or '1,5 GB' in gigabytes
+def get_size_gb(text):
+    parts = text.str.extract(SIZE_PATTERN)
+    size = pd.to_numeric(parts[0].str.replace(',', '.', regex=False), errors='coerce')
+    return size * parts[1].str.lower().map(SIZE_UNITS)
+
+
+def get_version(text, pattern):
+    return pd.to_numeric(text.str.extract(pattern)[0], errors='coerce')
+
+
+# 'Version 9.0c' in the DirectX requirement, or 'DirectX 11 compatible' in the graphics one
+def get_directx_version(directx, graphics):
+    version = parse_unique(lambda text: get_version(text, DIRECTX_PATTERN), directx)
+    return version.fillna(parse_unique(lambda text: get_version(text, DIRECTX_IN_TEXT_PATTERN), graphics))
+
+
+def get_os_generation(os):
+    versions = os[os.str.contains(WINDOWS_PATTERN, na=False)].str.extractall(OS_VERSION_PATTERN)[0]
+    generations = versions.str.lower().map(OS_GENERATIONS).groupby(level=0).min()
+    return generations.reindex(os.index)
+
+
+def get_tier(text, tiers):
+    conditions = [text.str.contains(pattern, na=False) for pattern, _ in tiers]
+    return pd.Series(np.select(conditions, [tier for _, tier in tiers], default=np.nan), index=text.index)
+
+
+# typed hardware columns of a requirements table (one row per app, one text column per requirement)
+def get_hardware_df(requirements_df):
+    df = requirements_df
+    return pd.DataFrame({'ram_gb': parse_unique(get_size_gb, get_column(df, ['memory'])),
+                         'storage_gb': parse_unique(get_size_gb, get_column(df, STORAGE_KEYS)),
+                         'directx_version': get_directx_version(get_column(df, ['directx']),
+                                                                get_column(df, ['graphics'])),
+                         'os_generation': parse_unique(get_os_generation, get_column(df, ['os'])),
+                         'cpu_tier': parse_unique(lambda text: get_tier(text, CPU_TIERS),
+                                                  get_column(df, ['processor'])),
+                         'gpu_tier': parse_unique(lambda text: get_tier(text, GPU_TIERS),
+                                                  get_column(df, ['graphics']))}, index=df.index)
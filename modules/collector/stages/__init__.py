@@ -0,0 +1,344 @@
+import pandas as pd
+import numpy as np
+from modules.collector import steam_data, igdb_data, steamspy_data, prices_data, players_data, registry
+from modules.collector import DATA_PATH, load_previous
+from utilities import misc, checkpoint, schema
+from utilities.dag import Stage
+
+# every stage below is a step of update_data with explicit inputs and outputs (see utilities.dag)
+# SteamSpy, prices and IGDB need only the appids, so they run concurrently with Steam and each other
+# rating waits for Steam (release dates) and SteamSpy (review counts that tell which apps changed)
+# fetch stages return the appids they fetched as fetched_<source>, the registry is updated once all stages finished
+
+
+def fetch_appids():
+    print('fetching appids')
+
+    # the registry knows every appid seen so far and when each source was last fetched for it
+    # runs before the registry existed only saved all_appids, their Steam and IGDB data count as fetched
+    registry_df = registry.load_registry(DATA_PATH + 'registry_df')
+    previous_appids = load_previous('all_appids')
+    if registry_df.empty and previous_appids is not None:
+        registry_df, old_appids = registry.register_appids(registry_df, previous_appids)
+        registry_df = registry.mark_fetched(registry_df, 'steam', old_appids)
+        registry_df = registry.mark_fetched(registry_df, 'igdb', old_appids)
+
+    # Steam data and IGDB data are fetched once per app (except critic scores), so only apps never fetched are due
+    # prices, players, ratings and SteamSpy are refreshed for the appids the registry finds due
+
+    all_apps = steam_data.get_all_apps()
+    all_appids = list(all_apps['appid'])
+
+    registry_df, _ = registry.register_appids(registry_df, all_appids)
+
+    # release dates and review counts of the previous run are enough to schedule the sources
+    # that do not wait for Steam data; apps without them (new apps) are due anyway
+    previous_apps_df = load_previous('apps_df')
+    previous_release_dates = None
+    if previous_apps_df is not None:
+        previous_release_dates = previous_apps_df.set_index('appid')['release_date']
+
+    previous_rating_df = load_previous('rating_df')
+    previous_reviews = None
+    if previous_rating_df is not None:
+        previous_reviews = previous_rating_df.set_index('appid')['reviews_total']
+
+    return {'registry_df': registry_df, 'all_appids': all_appids,
+            'previous_release_dates': previous_release_dates, 'previous_reviews': previous_reviews}
+
+
+# apps whose details did not come back (a 429 stopped the run, a 503 after the retries) stay due for the next run
+# apps Steam answered for are fetched, also those without details (success is false) and those that are not games
+def fetch_steam(registry_df, all_appids):
+    appids = registry.get_due_appids(registry_df, 'steam', all_appids)
+    steam_df_raw = steam_data.get_basic_info(appids, use_async=True, checkpoint=checkpoint.Checkpoint('steam'))
+    fetched = set(steam_df_raw['requested_appid'].dropna().astype(int))
+    steam_df = steam_data.clean_basic_info_df(steam_df_raw)
+
+    # release dates of every known app, for scheduling
+    apps_df = misc.merge_by_appid(load_previous('apps_df'), steam_df[['appid', 'release_date', 'coming_soon']])
+    apps_df = schema.apply(apps_df, steam_data.STEAM_DTYPES)
+
+    return {'steam_df': steam_df,
+            'apps_df': apps_df,
+            'images_df': steam_data.get_images_df(steam_df),
+            'languages_df': steam_data.get_languages_df(steam_df),
+            'categories_df': steam_data.get_categories_df(steam_df),
+            'steam_genres_df': steam_data.get_genres_df(steam_df),
+            'dlc_df': steam_data.get_dlc_df(steam_df),
+            'packages_df': steam_data.get_packages_df(steam_df),
+            'content_descriptors_df': steam_data.get_content_descriptors_df(steam_df),
+            'requirements_minimum_df': steam_data.get_requirements_minimum_df(steam_df),
+            'requirements_recommended_df': steam_data.get_requirements_recommended_df(steam_df),
+            'descriptions_df': steam_data.get_descriptions_df(steam_df),
+            'app_details_df': get_app_details_df(steam_df),
+            'fetched_steam': [appid for appid in appids if appid in fetched]}
+
+
+# review summaries are refetched only for apps whose review count is likely to have changed, most likely first
+# within RATING_REQUEST_BUDGET requests: SteamSpy review counts of this run are compared with the stored ones
+# apps never rated are always requested, outside the budget
+def fetch_rating(registry_df, apps_df, steamspy_reviews):
+    previous_rating_df = load_previous('rating_df')
+    if previous_rating_df is not None:
+        previous_rating_df = previous_rating_df.drop(['critic_score', 'critic_reviews_total'], axis=1, errors='ignore')
+
+    release_dates = apps_df.set_index('appid')['release_date']
+    appids = list(apps_df.query('coming_soon == False')['appid'])
+    expected_change = registry.get_expected_change(registry_df, 'rating', appids, steamspy_reviews, release_dates)
+    never_rated = expected_change == np.inf
+    appids = list(expected_change.index[never_rated]) + registry.prioritize_appids(expected_change[~never_rated],
+                                                                                  steam_data.RATING_REQUEST_BUDGET)
+
+    # SteamSpy API is faster than rating endpoint of Steam API, and it provides similar data
+    # But it lacks user score and score rank – they are always blank for some reason
+    # I can reverse engineer Steam user score formula or calculate SteamDB score instead
+    # (I think Steam score formula is the number of positive reviews divided by negative, but I'm not sure)
+    # It will make data collector faster but more vulnerable for errors on the SteamSpy side
+    # But for now, I keep this
+    # TODO: reverse-engineer Steam score formula
+    user_rating_df = steam_data.get_rating_df(appids, use_async=True, checkpoint=checkpoint.Checkpoint('rating'))
+    fetched = list(user_rating_df['appid'])
+    user_rating_df = schema.apply(misc.merge_by_appid(previous_rating_df, user_rating_df), steam_data.RATING_DTYPES)
+
+    return {'user_rating_df': user_rating_df, 'fetched_rating': fetched}
+
+
+# when many apps are due, reviews and playtime of all apps come from the paginated listing
+# and only the due apps with enough reviews get a per-app request for their tags
+def fetch_steamspy(registry_df, all_appids, previous_release_dates, previous_reviews):
+    appids = registry.get_due_appids(registry_df, 'steamspy', all_appids, previous_release_dates, previous_reviews)
+
+    if steamspy_data.is_bulk_cheaper(len(appids), len(registry_df)):
+        bulk_df = steamspy_data.get_steamspy_all_df(checkpoint=checkpoint.Checkpoint('steamspy_all'))
+        bulk_df = bulk_df[bulk_df['appid'].isin(all_appids)]
+        tag_appids = steamspy_data.get_tag_appids(bulk_df, appids)
+        steam_spy_df_raw = steamspy_data.get_steamspy_df(tag_appids, checkpoint=checkpoint.Checkpoint('steamspy'))
+        steam_spy_df = steamspy_data.clean_steam_spy_df(misc.merge_by_appid(bulk_df, steam_spy_df_raw))
+        # apps that need tags count as fetched only once their tags came back
+        fetched = (set(bulk_df['appid']) - set(tag_appids)) | steamspy_data.get_tagged_appids(steam_spy_df_raw)
+        fetched = [appid for appid in appids if appid in fetched]
+    else:
+        steam_spy_df_raw = steamspy_data.get_steamspy_df(appids, checkpoint=checkpoint.Checkpoint('steamspy'))
+        steam_spy_df = steamspy_data.clean_steam_spy_df(steam_spy_df_raw)
+        fetched = list(steam_spy_df_raw['appid'])
+
+    playtime_df = misc.merge_by_appid(load_previous('playtime_df'), steamspy_data.get_playtime_df(steam_spy_df))
+    playtime_df = schema.apply(playtime_df, steamspy_data.STEAMSPY_DTYPES)
+    tags_df_raw = steamspy_data.get_tags_df(steam_spy_df_raw)
+    tags_df = misc.merge_by_appid(load_previous('tags_df'), steamspy_data.normalize_tags_df(tags_df_raw)).fillna(0)
+    tags_df = schema.apply(tags_df, steamspy_data.TAGS_DTYPES)
+
+    steamspy_reviews = steam_spy_df.set_index('appid')[['positive', 'negative']].sum(axis=1).astype(float)
+
+    return {'playtime_df': playtime_df, 'tags_df': tags_df, 'steamspy_reviews': steamspy_reviews,
+            'fetched_steamspy': fetched}
+
+
+# player stats saved as {appid: df} (player_stats_dict) before the long table are converted on load
+def load_previous_player_stats():
+    player_stats_df = load_previous('player_stats_df')
+    if player_stats_df is None:
+        player_stats_dict = load_previous('player_stats_dict')
+        if player_stats_dict is not None:
+            player_stats_df = players_data.player_stats_dict_to_long_df(player_stats_dict)
+    return player_stats_df
+
+
+def fetch_players(registry_df, apps_df, user_rating_df):
+    release_dates = apps_df.set_index('appid')['release_date']
+    reviews = user_rating_df.set_index('appid')['reviews_total']
+    appids_filter_1 = list(user_rating_df.query('reviews_total >= 10')['appid'])
+
+    appids = registry.get_due_appids(registry_df, 'players', appids_filter_1, release_dates, reviews)
+    player_stats_df, fetched = players_data.get_all_player_stats(appids, list(release_dates.reindex(appids)),
+                                                                 checkpoint=checkpoint.Checkpoint('players'))
+    player_stats_df = misc.merge_by_appid(load_previous_player_stats(), player_stats_df)
+    player_stats_df = schema.apply(player_stats_df, players_data.PLAYER_DTYPES)
+    player_info_df = players_data.get_player_info_df(player_stats_df, appids_filter_1)
+
+    return {'player_stats_df': player_stats_df, 'player_info_df': player_info_df, 'fetched_players': fetched}
+
+
+# current prices are refreshed in batches for the whole catalogue
+# full price history is scraped for new apps, apps whose price changed since the last run
+# and apps whose history the registry finds stale
+def fetch_prices(registry_df, all_appids, previous_release_dates, previous_reviews):
+    current_prices_df = steam_data.get_current_prices(all_appids, checkpoint=checkpoint.Checkpoint('current_prices'))
+
+    price_stats_dict = load_previous('price_stats_dict')
+    old_current_prices_df = load_previous('current_prices_df')
+    if price_stats_dict is None or old_current_prices_df is None:
+        price_stats_dict = {}
+        old_current_prices_df = None
+
+    appids_to_scrape = set(prices_data.get_appids_to_scrape(all_appids, current_prices_df, old_current_prices_df,
+                                                            price_stats_dict))
+    appids_to_scrape |= set(registry.get_due_appids(registry_df, 'prices', all_appids, previous_release_dates,
+                                                    previous_reviews))
+    appids_to_scrape = [appid for appid in all_appids if appid in appids_to_scrape]
+    scraped = prices_data.get_all_prices(appids_to_scrape, checkpoint=checkpoint.Checkpoint('prices'))
+    price_stats_dict.update(scraped)
+    price_info_df = prices_data.get_price_info_df(price_stats_dict, current_prices_df)
+
+    return {'current_prices_df': current_prices_df, 'price_stats_dict': price_stats_dict,
+            'price_info_df': price_info_df, 'fetched_prices': [appid for appid in appids_to_scrape if appid in scraped]}
+
+
+# only apps IGDB has a game for count as fetched, the rest are looked up again in the next run
+# (IGDB adds games later, and the lookup costs one request per 5000 apps)
+def fetch_igdb(registry_df, all_appids):
+    appids = registry.get_due_appids(registry_df, 'igdb', all_appids)
+    appid_to_igdbid = igdb_data.get_igdb_ids(appids, checkpoint=checkpoint.Checkpoint('igdb_ids'))
+    igdb_info_df_raw = igdb_data.get_igdb_info(appid_to_igdbid['igdbid'], checkpoint=checkpoint.Checkpoint('igdb_info'))
+    igdb_info_df = igdb_data.clean_igdb_info(igdb_info_df_raw, appid_to_igdbid)
+    fetched = set(igdb_info_df['appid'].dropna())
+
+    return {'appid_to_igdbid': appid_to_igdbid,
+            'igdb_info_df': igdb_info_df,
+            'igdb_genres_df': igdb_data.get_genres_df(igdb_info_df),
+            'themes_df': igdb_data.get_themes_df(igdb_info_df),
+            'game_modes_df': igdb_data.get_game_modes_df(igdb_info_df),
+            'keywords_df': igdb_data.get_keywords_df(igdb_info_df),
+            'player_perspectives_df': igdb_data.get_player_perspectives_df(igdb_info_df),
+            'fetched_igdb': [appid for appid in appids if appid in fetched]}
+
+
+# IGDB columns of every app found on IGDB so far: this run's igdb_info_df over the saved one over the saved fallback
+# table (rating_df and summary_df held the IGDB columns before igdb_info_df was saved)
+def get_all_igdb_info(igdb_info_df, columns, fallback):
+    result = schema.apply(pd.DataFrame(columns=columns), igdb_data.IGDB_INFO_DTYPES)
+    for df in (load_previous(fallback), load_previous('igdb_info_df'), igdb_info_df):
+        if df is not None and set(columns) <= set(df.columns):
+            result = misc.merge_by_appid(result, df[columns])
+    return schema.apply(result, igdb_data.IGDB_INFO_DTYPES)
+
+
+# owners and revenue are estimates from reviews and can outgrow int32
+SUMMARY_DTYPES = {**steam_data.STEAM_DTYPES, **prices_data.PRICE_INFO_DTYPES, **igdb_data.IGDB_INFO_DTYPES,
+                  'reviews_total': 'int32', 'owners': 'int64', 'revenue': 'int64'}
+
+
+# columns of steam_df that are saved in their own tables or not at all, the rest are the app details of summary_df
+NOT_DETAILS = ['header_image', 'background', 'screenshots', 'movies', 'dlc', 'categories', 'genres', 'languages',
+               'packages', 'content_descriptors_ids', 'content_descriptors_notes', 'pc_requirements_minimum',
+               'pc_requirements_recommended', 'metacritic_score', 'metacritic_url', 'detailed_description',
+               'about_the_game', 'short_description']
+IGDB_SUMMARY_COLUMNS = ['appid', 'age_rating', 'game_engine', 'collection', 'is_collection']
+
+
+# Steam details of every app fetched so far, saves from before app_details_df kept them only in summary_df
+def get_app_details_df(steam_df):
+    previous = load_previous('app_details_df')
+    if previous is None:
+        previous = load_previous('summary_df')
+    if previous is not None:
+        previous = previous[[column for column in previous.columns if column in steam_df.columns]]
+
+    details = steam_df.drop(NOT_DETAILS, errors='ignore', axis=1)
+    return schema.apply(misc.merge_by_appid(previous, details), steam_data.STEAM_DTYPES)
+
+
+# Steam details are fetched once per app, while ratings, prices and IGDB data arrive or change in later runs,
+# so the summary of every app is rebuilt from all of them in every run
+def build_summary(steam_df, app_details_df, user_rating_df, price_info_df, igdb_info_df):
+    summary_df = app_details_df.merge(user_rating_df[['appid', 'reviews_total']])
+    summary_df = summary_df.merge(price_info_df, on='appid')
+
+    # OWNERS AND REVENUE
+    summary_df['owners'] = steam_data.get_owners(summary_df)
+    summary_df['revenue'] = steam_data.get_revenue(summary_df)
+
+    # TODO: add condition, check if there are collection and franchise columns in new data, and merge after that
+    # TODO: or forcibly add collection and franchise columns if there are none
+    summary_df = summary_df.merge(get_all_igdb_info(igdb_info_df, IGDB_SUMMARY_COLUMNS, 'summary_df'))
+
+    # platforms of the apps whose Steam details or IGDB data came in this run
+    changed = summary_df['appid'].isin(steam_df['appid']) | summary_df['appid'].isin(igdb_info_df['appid'])
+    platforms_df = igdb_data.get_platforms_df(igdb_info_df, summary_df[changed])
+
+    return {'summary_df': schema.apply(summary_df, SUMMARY_DTYPES), 'platforms_df': platforms_df}
+
+
+# IGDB data is fetched once per app, so critic scores come from all IGDB data saved so far
+# and apps without them (not on IGDB, or not yet) keep their ratings with empty critic columns
+# a selective refresh passes the saved rating_df as user_rating_df and no igdb_info_df when IGDB is not refreshed
+def merge_critic_scores(user_rating_df, igdb_info_df):
+    user_rating_df = user_rating_df.drop(['critic_score', 'critic_reviews_total'], axis=1, errors='ignore')
+    critic_df = get_all_igdb_info(igdb_info_df, ['appid', 'critic_score', 'critic_reviews_total'], 'rating_df')
+
+    return {'rating_df': schema.apply(user_rating_df.merge(critic_df, on='appid', how='left'),
+                                      steam_data.RATING_DTYPES)}
+
+
+STAGES = [
+    Stage('appids', fetch_appids,
+          outputs=['registry_df', 'all_appids', 'previous_release_dates', 'previous_reviews']),
+    Stage('steam', fetch_steam, inputs=['registry_df', 'all_appids'],
+          outputs=['steam_df', 'apps_df', 'images_df', 'languages_df', 'categories_df', 'steam_genres_df', 'dlc_df',
+                   'packages_df', 'content_descriptors_df', 'requirements_minimum_df', 'requirements_recommended_df',
+                   'descriptions_df', 'app_details_df', 'fetched_steam']),
+    Stage('rating', fetch_rating, inputs=['registry_df', 'apps_df', 'steamspy_reviews'],
+          outputs=['user_rating_df', 'fetched_rating']),
+    Stage('steamspy', fetch_steamspy,
+          inputs=['registry_df', 'all_appids', 'previous_release_dates', 'previous_reviews'],
+          outputs=['playtime_df', 'tags_df', 'steamspy_reviews', 'fetched_steamspy']),
+    Stage('players', fetch_players, inputs=['registry_df', 'apps_df', 'user_rating_df'],
+          outputs=['player_stats_df', 'player_info_df', 'fetched_players']),
+    Stage('prices', fetch_prices, inputs=['registry_df', 'all_appids', 'previous_release_dates', 'previous_reviews'],
+          outputs=['current_prices_df', 'price_stats_dict', 'price_info_df', 'fetched_prices']),
+    Stage('igdb', fetch_igdb, inputs=['registry_df', 'all_appids'],
+          outputs=['appid_to_igdbid', 'igdb_info_df', 'igdb_genres_df', 'themes_df', 'game_modes_df', 'keywords_df',
+                   'player_perspectives_df', 'fetched_igdb']),
+    Stage('summary', build_summary,
+          inputs=['steam_df', 'app_details_df', 'user_rating_df', 'price_info_df', 'igdb_info_df'],
+          outputs=['summary_df', 'platforms_df']),
+    Stage('critic', merge_critic_scores, inputs=['user_rating_df', 'igdb_info_df'], outputs=['rating_df']),
+]
+
+# stages derived from sources that a selective refresh of any of those sources runs too, so their tables are saved
+DERIVED_STAGES = {'critic': ['rating', 'igdb']}
+# intermediate inputs of the source stages that a selective refresh takes from the saved tables instead
+SAVED_INPUTS = {'apps_df': 'apps_df', 'user_rating_df': 'rating_df'}
+# and the inputs it goes without
+OPTIONAL_INPUTS = ['steamspy_reviews', 'igdb_info_df']
+
+# outputs saved to DATA_PATH under their names, the rest are intermediate
+TO_SAVE = ['all_appids', 'registry_df', 'apps_df', 'summary_df', 'rating_df', 'images_df', 'languages_df',
+           'categories_df', 'dlc_df', 'packages_df', 'content_descriptors_df', 'requirements_minimum_df',
+           'requirements_recommended_df', 'descriptions_df', 'playtime_df', 'tags_df', 'player_stats_df',
+           'price_stats_dict', 'player_info_df', 'price_info_df', 'current_prices_df', 'appid_to_igdbid',
+           'platforms_df', 'steam_genres_df', 'igdb_genres_df', 'themes_df', 'game_modes_df', 'keywords_df',
+           'player_perspectives_df', 'igdb_info_df', 'app_details_df']
+
+# tables saved with only some of their columns, the lists of igdb_info_df are saved as dummy tables
+SAVED_COLUMNS = {'igdb_info_df': list(igdb_data.IGDB_INFO_DTYPES)}
+
+# saved tables from older versions are converted by these before being merged with the new rows
+MIGRATIONS = {'requirements_minimum_df': steam_data.migrate_requirements_df,
+              'requirements_recommended_df': steam_data.migrate_requirements_df}
+
+# dense dummy tables, a column only one side of a merge with the saved table has is 0 on the other
+ZERO_FILLED = ['tags_df', 'platforms_df']
+
+# dtypes the saved tables are checked against (see utilities.schema), sparse dummy tables are stored as they are
+SCHEMAS = {'apps_df': steam_data.STEAM_DTYPES,
+           'summary_df': SUMMARY_DTYPES,
+           'rating_df': steam_data.RATING_DTYPES,
+           'images_df': steam_data.STEAM_DTYPES,
+           'dlc_df': steam_data.STEAM_DTYPES,
+           'packages_df': steam_data.STEAM_DTYPES,
+           'content_descriptors_df': steam_data.STEAM_DTYPES,
+           'descriptions_df': steam_data.STEAM_DTYPES,
+           'app_details_df': steam_data.STEAM_DTYPES,
+           'requirements_minimum_df': steam_data.REQUIREMENTS_DTYPES,
+           'requirements_recommended_df': steam_data.REQUIREMENTS_DTYPES,
+           'current_prices_df': steam_data.CURRENT_PRICES_DTYPES,
+           'playtime_df': steamspy_data.STEAMSPY_DTYPES,
+           'tags_df': steamspy_data.TAGS_DTYPES,
+           'player_stats_df': players_data.PLAYER_DTYPES,
+           'player_info_df': players_data.PLAYER_INFO_DTYPES,
+           'price_info_df': prices_data.PRICE_INFO_DTYPES,
+           'appid_to_igdbid': igdb_data.IGDB_IDS_DTYPES,
+           'igdb_info_df': igdb_data.IGDB_INFO_DTYPES,
+           'platforms_df': igdb_data.PLATFORMS_DTYPES}
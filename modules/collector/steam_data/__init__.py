@@ -1,24 +1,74 @@
 import pandas as pd
 import numpy as np
 import re
+import html
 import json
-import requests
 import datetime
 import time
+import asyncio
+import aiohttp
 from tqdm import tqdm
 from utilities.exceptions import ServiceUnavailableException, TooManyRequestsException
-from utilities import misc
+from utilities import misc, client, metrics, schema, pool
+from utilities.schema import TEXT, OTHER
+from modules.collector import requirements
 
 # STEAM API ENDPOINTS
 ALL_APPS_ENDPOINT = "https://api.steampowered.com/ISteamApps/GetAppList/v2/"
 BASIC_INFO_ENDPOINT = "https://store.steampowered.com/api/appdetails?appids={}&cc=us&l=en"
 RATING_ENDPOINT = "https://store.steampowered.com/appreviews/{}?json=1&language=all&purchase_type=all&num_per_page=1"
-
-TAG_PATTERN = re.compile('<.*?>')
+# appdetails accepts a comma-separated list of appids only when filtered down to price_overview
+PRICE_OVERVIEW_ENDPOINT = "https://store.steampowered.com/api/appdetails?appids={}&filters=price_overview&cc=us&l=en"
+
+RATING_COLUMNS = ['appid', 'num_reviews', 'review_score', 'total_positive', 'total_negative', 'reviews_total']
+CURRENT_PRICES_COLUMNS = ['appid', 'currency', 'initial_price', 'current_price', 'discount_percent']
+# appdetails fields the cleaning reads, every batch gets all of them (also an empty batch, or one where no app has dlc)
+BASIC_INFO_COLUMNS = ['requested_appid', 'success', 'data.type', 'data.name', 'data.steam_appid',
+                      'data.controller_support', 'data.dlc', 'data.detailed_description', 'data.about_the_game',
+                      'data.short_description', 'data.supported_languages', 'data.header_image', 'data.website',
+                      'data.pc_requirements.minimum', 'data.pc_requirements.recommended', 'data.developers',
+                      'data.publishers', 'data.price_overview.initial', 'data.packages', 'data.platforms.windows',
+                      'data.platforms.mac', 'data.platforms.linux', 'data.metacritic.score', 'data.metacritic.url',
+                      'data.categories', 'data.genres', 'data.screenshots', 'data.movies',
+                      'data.release_date.coming_soon', 'data.release_date.date', 'data.background',
+                      'data.content_descriptors.ids', 'data.content_descriptors.notes']
+# at most this many review summaries of rated apps are refetched per run (200 per 5 minutes: 6000 take 2.5 hours)
+# apps never rated are requested on top of it, a new app gets into summary_df only with its rating
+RATING_REQUEST_BUDGET = 6000
+
+TAG_PATTERN = re.compile('<[^>]*>')
+LANGUAGE_NOTES_PATTERN = re.compile(r'languages with full audio support|\*| -')
+LANGUAGE_SEPARATOR_PATTERN = re.compile(r'\s*,\s*')
+DESCRIPTION_COLUMNS = ['detailed_description', 'about_the_game', 'short_description']
+# release dates come as '21 Aug, 2012' or 'Aug 21, 2012', anything else with a digit ('Q3 2024') is parsed one by one
+# and the rest ('Coming soon') is NaT
+RELEASE_DATE_FORMATS = ['%d %b, %Y', '%b %d, %Y']
+DIGIT_PATTERN = re.compile(r'\d')
+TOTALS = {'dlc': 'dlcs_total', 'packages': 'packages_total', 'languages': 'languages_total',
+          'screenshots': 'screenshots_total'}
+# requirement names ('OS *', 'Hard Drive') become column names ('os', 'hard_drive')
+REQUIREMENT_KEY_PATTERN = re.compile(r'[^a-z0-9]+')
+
+# schemas of the cleaned tables (see utilities.schema), the tables cut from steam_df take the dtypes of their columns
+STEAM_DTYPES = {'appid': 'int32', 'name': TEXT, 'controller_support': 'bool', 'detailed_description': TEXT,
+                'about_the_game': TEXT, 'short_description': TEXT, 'header_image': TEXT, 'capsule_image': TEXT,
+                'capsule_imagev5': TEXT, 'website': TEXT, 'developers': 'category', 'publishers': 'category',
+                'background': TEXT, 'content_descriptors_notes': TEXT, 'coming_soon': 'bool',
+                'release_date': 'datetime64[ns]', 'windows': 'bool', 'mac': 'bool', 'linux': 'bool',
+                'metacritic_score': 'Int32', 'metacritic_url': TEXT, 'price_initial': 'Int32',
+                'pc_requirements_minimum': TEXT, 'pc_requirements_recommended': TEXT, 'release_year': 'Int32',
+                'dlcs_total': 'int32', 'packages_total': 'int32', 'languages_total': 'int32',
+                'screenshots_total': 'int32'}
+RATING_DTYPES = {'appid': 'int32', 'num_reviews': 'int32', 'review_score': 'int32', 'total_positive': 'int32',
+                 'total_negative': 'int32', 'reviews_total': 'int32', 'critic_score': 'float32',
+                 'critic_reviews_total': 'Int32'}
+CURRENT_PRICES_DTYPES = {'appid': 'int32', 'currency': 'category', 'initial_price': 'float32',
+                         'current_price': 'float32', 'discount_percent': 'int32'}
+REQUIREMENTS_DTYPES = {'appid': 'int32', **requirements.HARDWARE_DTYPES, OTHER: TEXT}
 
 
 def get_all_apps():
-    response = requests.get(ALL_APPS_ENDPOINT)
+    response = client.get(ALL_APPS_ENDPOINT)
     if response.status_code != 200:
         raise Exception(f'Error {response.status_code}')
     response_formatted = pd.json_normalize(json.loads(response.content)['applist']['apps'])
@@ -26,65 +76,219 @@ def get_all_apps():
     return response_formatted
 
 
-# Steam API is rate limited to 200 requests per 5 minutes
-def get_basic_info(appids, basket_timelimit=300, basket_countlimit=200):
+# apps Steam has no details for come back as {"success": false}, requested_appid tells which app that was
+def parse_basic_info(appid, content):
+    response_formatted = pd.json_normalize(json.loads(content))
+    response_formatted.columns = [col.replace(f'{appid}.', '') for col in response_formatted.columns]
+    response_formatted['requested_appid'] = appid
+    return response_formatted
+
+
+def parse_rating(appid, content):
+    response_formatted = pd.json_normalize(json.loads(content)['query_summary'])
+    response_formatted['appid'] = appid
+    return response_formatted
+
+
+# keeps up to max_in_flight requests open at once, while the adaptive limiter of the host (see utilities.client)
+# decides when the next one may start and how many may be open, so the rate follows what the server accepts
+# 429 and 503 are retried like in client.request, an app still unavailable after its retries is skipped
+# and only a 429 after all retries stops the collection, the rest is left for the next run
+# results keep the order of appids
+# with a checkpoint, appids done in a previous run are skipped and every new result is stored as it arrives
+async def collect_async(appids, endpoint, parse, function_desc, max_in_flight=20, checkpoint=None):
+    store = client.get_store()
+    limiter = client.get_limiter(endpoint)
+    todo = appids if checkpoint is None else checkpoint.remaining(appids)
+    results = [None] * len(todo)
+    queue = iter(enumerate(todo))
+    too_many_requests = asyncio.Event()
+    pbar = tqdm(total=len(appids), initial=len(appids) - len(todo), desc=function_desc.upper())
+
+    async def fetch(session, url):
+        attempt = 0
+        while True:
+            await limiter.acquire_async()
+            started = time.perf_counter()
+            try:
+                async with session.get(client.resolve(url), headers=store.conditional_headers(url)) as response:
+                    body = await response.read()
+            except Exception:
+                limiter.release()
+                raise
+            retry_after = client.get_retry_after(response.headers)
+            limiter.release(response.status, retry_after)
+            metrics.observe_request(client.get_host(url), response.status, time.perf_counter() - started, len(body))
+
+            if attempt >= client.RETRIES.get(response.status, 0):
+                return response, body
+            backoff = client.get_backoff(attempt, retry_after)
+            metrics.observe_wait(f'{client.get_host(url)} backoff', backoff)
+            await asyncio.sleep(backoff)
+            attempt += 1
+
+    async def worker(session):
+        for i, appid in queue:
+            if too_many_requests.is_set():
+                return
+            url = endpoint.format(appid)
+            response, body = await fetch(session, url)
+            if response.status == 304:
+                results[i] = store.load(url)
+            elif response.status == 503:
+                print(f'App {appid} unavailable')
+            elif response.status == 429:
+                print(f'Too many requests')
+                too_many_requests.set()
+                return
+            else:
+                results[i] = parse(appid, body)
+                store.save(url, response.headers, results[i])
+            if checkpoint is not None and results[i] is not None:
+                checkpoint.add(appid, results[i])
+            pbar.update(1)
+
+    connector = aiohttp.TCPConnector(limit=max_in_flight)
+    try:
+        async with aiohttp.ClientSession(connector=connector) as session:
+            await asyncio.gather(*[worker(session) for _ in range(max_in_flight)])
+    finally:
+        if checkpoint is not None:
+            checkpoint.flush()
+    pbar.close()
+
+    if checkpoint is not None:
+        return checkpoint.results(appids)
+    return [x for x in results if x is not None]
+
+
+def format_basic_info_df(results):
+    return pd.concat([pd.DataFrame(columns=BASIC_INFO_COLUMNS)] + list(results)).reset_index(drop=True)
+
+
+# Steam API allows about 200 requests per 5 minutes, the adaptive limiter of the host paces the requests
+def get_basic_info(appids, use_async=False, max_in_flight=20, checkpoint=None):
     function_desc = 'collecting app details from Steam'
+
+    if use_async:
+        results = asyncio.run(collect_async(appids, BASIC_INFO_ENDPOINT, parse_basic_info, function_desc,
+                                            max_in_flight, checkpoint))
+        return format_basic_info_df(results)
+
     results = []
+    todo = appids if checkpoint is None else checkpoint.remaining(appids)
 
-    basket_start = datetime.datetime.now()
-    total_count = 0
-    for appid in tqdm(appids, desc=function_desc.upper()):
+    for appid in tqdm(todo, desc=function_desc.upper()):
         try:
-            basket_duration = (datetime.datetime.now() - basket_start).seconds
-            total_count += 1
+            results.append(client.get_parsed(BASIC_INFO_ENDPOINT.format(appid),
+                                             lambda response: parse_basic_info(appid, response.content)))
+            if checkpoint is not None:
+                checkpoint.add(appid, results[-1])
 
-            if basket_duration >= basket_timelimit:
-                basket_start = datetime.datetime.now()
+        except TooManyRequestsException:
+            print(f'Too many requests')
+            break
+        except ServiceUnavailableException:
+            print(f'App {appid} unavailable')
+        except:
+            if checkpoint is not None:
+                checkpoint.flush()
+            raise
 
-            if total_count / basket_countlimit == total_count // basket_countlimit:
-                time.sleep(basket_timelimit - basket_duration + 1)
+    if checkpoint is not None:
+        results = checkpoint.results(appids)
+    return format_basic_info_df(results)
 
-            response = requests.get(BASIC_INFO_ENDPOINT.format(appid))
 
-            if response.status_code == 503:
-                raise ServiceUnavailableException
-            if response.status_code == 429:
-                raise TooManyRequestsException
+def parse_price_overview(content):
+    results = []
+    for appid, app in json.loads(content).items():
+        if not app['success']:
+            continue
+        # free apps come back with an empty list instead of price_overview
+        price = app['data'].get('price_overview', {}) if app['data'] else {}
+        results.append({'appid': int(appid),
+                        'currency': price.get('currency', np.nan),
+                        'initial_price': price.get('initial', 0) / 100,
+                        'current_price': price.get('final', 0) / 100,
+                        'discount_percent': price.get('discount_percent', 0)})
+
+    return pd.DataFrame(results, columns=CURRENT_PRICES_COLUMNS)
+
+
+# one request refreshes the current price of batch_size apps, so the whole catalogue fits in a few hundred requests
+# checkpoints are kept per batch, keyed by the appids of the batch
+def get_current_prices(appids, batch_size=300, checkpoint=None):
+    function_desc = 'collecting current prices from Steam'
+    results = []
 
-            response_formatted = pd.json_normalize(json.loads(response.content))
-            response_formatted.columns = [col.replace(f'{appid}.', '') for col in response_formatted.columns]
-            results.append(response_formatted)
+    batches = [','.join(str(appid) for appid in appids[i:i + batch_size]) for i in range(0, len(appids), batch_size)]
+    todo = batches if checkpoint is None else checkpoint.remaining(batches)
+    for batch in tqdm(todo, desc=function_desc.upper()):
+        try:
+            results.append(client.get_parsed(PRICE_OVERVIEW_ENDPOINT.format(batch),
+                                             lambda response: parse_price_overview(response.content),
+                                             revalidate=False))
+            if checkpoint is not None:
+                checkpoint.add(batch, results[-1])
 
         except TooManyRequestsException:
             print(f'Too many requests')
-            print(
-                f'Basket duration: {basket_duration} | Basket count: {total_count - total_count // basket_countlimit * basket_countlimit}')
-            return pd.concat(results)
+            break
         except ServiceUnavailableException:
-            print(f'App {appid} unavailable')
+            print(f'Batch starting with app {batch.split(",")[0]} unavailable')
         except:
+            if checkpoint is not None:
+                checkpoint.flush()
             raise
 
-    return pd.concat(results)
+    if checkpoint is not None:
+        results = checkpoint.results(batches)
+    if not results:
+        return schema.apply(pd.DataFrame(columns=CURRENT_PRICES_COLUMNS), CURRENT_PRICES_DTYPES)
+    return schema.apply(pd.concat(results).reset_index(drop=True), CURRENT_PRICES_DTYPES)
+
+
+# entities are decoded after the tags are gone, so an escaped &lt;b&gt; stays text
+# splitting and joining collapses whitespace much faster than a regex
+def unescape_text(string):
+    return ' '.join(html.unescape(string).split())
 
 
 def remove_tags(string):
-    string_clean = re.sub(TAG_PATTERN, ' ', string)
-    string_clean = string_clean.replace('&quot;', "'").replace('&gt;', '')
-    string_clean = " ".join(string_clean.split())
-    return string_clean
+    return unescape_text(TAG_PATTERN.sub(' ', string))
 
 
-def clean_languages(language_series):
-    results = []
-    for e in language_series:
-        if type(e) == float:
-            results.append(np.nan)
-        else:
-            results.append([x.strip() for x in remove_tags(e).replace(
-                'languages with full audio support', '').replace('*', '').replace(' -', '').split(',')])
+# remove_tags over a whole Series, NaN stays NaN
+def clean_text(series):
+    text = series.astype(object).str.replace(TAG_PATTERN, ' ', regex=True)
+    return text.map(unescape_text, na_action='ignore')
+
+
+# the description columns are cleaned as one long Series, in chunks spread over the cores
+def clean_descriptions(df):
+    if df.empty:
+        return df
+    stacked = pd.concat([df[col] for col in DESCRIPTION_COLUMNS], keys=DESCRIPTION_COLUMNS)
+    cleaned = pool.map_chunks(clean_text, stacked)
+    for col in DESCRIPTION_COLUMNS:
+        df[col] = cleaned.loc[col]
+    return df
 
-    return results
+
+def parse_release_dates(series):
+    dates = pd.Series(pd.NaT, index=series.index, dtype='datetime64[ns]')
+    for date_format in RELEASE_DATE_FORMATS:
+        dates = dates.fillna(pd.to_datetime(series, format=date_format, errors='coerce'))
+
+    rest = dates.isna() & series.str.contains(DIGIT_PATTERN, na=False)
+    dates[rest] = [pd.to_datetime(x, errors='coerce') for x in series[rest]]
+    return dates
+
+
+def clean_languages(language_series):
+    text = clean_text(language_series).str.replace(LANGUAGE_NOTES_PATTERN, '', regex=True).str.strip()
+    return text.str.split(LANGUAGE_SEPARATOR_PATTERN, regex=True)
 
 
 def extract_from_dict_series(series, dict_key):
@@ -120,7 +324,7 @@ def clean_basic_info_df(df):
         '.', '_') for col in df.columns]
 
     df = df.query('success == True and type == "game"')
-    df = df.drop(['price_currency', 'price_initial_formatted',
+    df = df.drop(['requested_appid', 'price_currency', 'price_initial_formatted',
                   'price_final_formatted', 'success', 'type',
                   'ext_user_account_notice', 'legal_notice',
                   'price_discount_percent', 'price_final',
@@ -161,77 +365,67 @@ def clean_basic_info_df(df):
     except KeyError:
         pass
 
-    df['about_the_game'] = [remove_tags(x) for x in df['about_the_game']]
-    df['short_description'] = [remove_tags(x) for x in df['short_description']]
-    df['detailed_description'] = [remove_tags(x) for x in df['detailed_description']]
-
+    df = clean_descriptions(df)
     df['languages'] = clean_languages(df['languages'])
 
-    df['appid'] = df['appid'].astype(int)
-    df['release_date'] = [pd.to_datetime(x, errors='coerce') for x in df['release_date']]
-    df['coming_soon'] = df['coming_soon'].astype(bool)
-    df['windows'] = df['windows'].astype(bool)
-    df['mac'] = df['mac'].astype(bool)
-    df['linux'] = df['linux'].astype(bool)
+    df['release_date'] = parse_release_dates(df['release_date'])
+    df['release_year'] = df['release_date'].dt.year
 
-    df['release_year'] = [x.year for x in df['release_date']]
-    df['dlcs_total'] = [len(x) for x in df['dlc']]
-    df['packages_total'] = [len(x) for x in df['packages']]
-    df['languages_total'] = [len(x) for x in df['languages']]
-    df['screenshots_total'] = [len(x) for x in df['screenshots']]
-    df['developers'] = [x[0] if type(x) != float else np.nan for x in df['developers']]
-    df['publishers'] = [x[0] if type(x) != float else np.nan for x in df['publishers']]
+    # .str works on lists too, apps without dlc etc. have none of them
+    # (columns of an empty batch, or of a batch where no app has dlc, are not object columns, so they are cast first)
+    for col, total in TOTALS.items():
+        df[total] = df[col].astype(object).str.len().fillna(0)
+    df['developers'] = df['developers'].astype(object).str[0]
+    df['publishers'] = df['publishers'].astype(object).str[0]
 
-    for col in df.columns:
-        df[col] = [misc.empty_to_nan(x) for x in df[col]]
+    # only object columns can hold empty strings and lists
+    for col in df.select_dtypes(include='object').columns:
+        df[col] = misc.empty_to_nan(df[col])
 
-    return df.reset_index(drop=True)
+    return schema.apply(df.reset_index(drop=True), STEAM_DTYPES)
 
 
-def get_rating_df(appids, basket_timelimit=300, basket_countlimit=200):
-    function_desc = 'collecting rating data'
-    results = []
-
-    basket_start = datetime.datetime.now()
-    total_count = 0
-    for appid in tqdm(appids, desc=function_desc.upper()):
-        try:
-            basket_duration = (datetime.datetime.now() - basket_start).seconds
-            total_count += 1
+def format_rating_df(results):
+    if not results:
+        return schema.apply(pd.DataFrame(columns=RATING_COLUMNS), RATING_DTYPES)
+    results = pd.concat(results)
+    results = results.drop(['review_score_desc'], axis=1)
+    results = results.rename(columns={'total_reviews': 'reviews_total'})
+    results = results.reindex(['appid'] + [col for col in results.columns if col != 'appid'], axis='columns')
+    return schema.apply(results.reset_index(drop=True), RATING_DTYPES)
 
-            if basket_duration >= basket_timelimit:
-                basket_start = datetime.datetime.now()
 
-            if total_count / basket_countlimit == total_count // basket_countlimit:
-                time.sleep(basket_timelimit - basket_duration + 1)
+def get_rating_df(appids, use_async=False, max_in_flight=20, checkpoint=None):
+    function_desc = 'collecting rating data'
 
-            response = requests.get(RATING_ENDPOINT.format(appid))
+    if use_async:
+        results = asyncio.run(collect_async(appids, RATING_ENDPOINT, parse_rating, function_desc, max_in_flight,
+                                            checkpoint))
+        return format_rating_df(results)
 
-            if response.status_code == 503:
-                raise ServiceUnavailableException
-            if response.status_code == 429:
-                raise TooManyRequestsException
+    results = []
+    todo = appids if checkpoint is None else checkpoint.remaining(appids)
 
-            response_formatted = pd.json_normalize(json.loads(response.content)['query_summary'])
-            response_formatted.columns = [col.replace(f'{appid}.', '') for col in response_formatted.columns]
-            results.append(response_formatted)
+    for appid in tqdm(todo, desc=function_desc.upper()):
+        try:
+            results.append(client.get_parsed(RATING_ENDPOINT.format(appid),
+                                             lambda response: parse_rating(appid, response.content)))
+            if checkpoint is not None:
+                checkpoint.add(appid, results[-1])
 
         except TooManyRequestsException:
             print(f'Too many requests')
-            print(
-                f'Basket duration: {basket_duration} | Basket count: {total_count - total_count // basket_countlimit * basket_countlimit}')
-            return pd.concat(results)
+            break
         except ServiceUnavailableException:
             print(f'App {appid} unavailable')
         except:
+            if checkpoint is not None:
+                checkpoint.flush()
             raise
 
-    results = pd.concat(results)
-    results['appid'] = appids
-    results = results.drop(['review_score_desc'], axis=1)
-    results = results.rename(columns={'total_reviews': 'reviews_total'})
-    results = results.reindex(list(results.columns[-1:]) + list(results.columns[:-1]), axis='columns')
-    return results
+    if checkpoint is not None:
+        results = checkpoint.results(appids)
+    return format_rating_df(results)
 
 
 def get_images_df(df):
@@ -269,31 +463,53 @@ def get_genres_df(df):
     return steam_genres_df
 
 
+# one row per app with requirements: a text column per listed requirement ('<li>Memory: 8 GB RAM' goes to memory,
+# an item without a name to other) and the numeric hardware columns parsed from them
+# (see modules.collector.requirements); the items of all apps are split and cleaned at once, then pivoted
 def get_requirements_df(df, param):
-    results = []
-    requirements_df = pd.DataFrame()
+    if param not in df.columns:
+        return pd.DataFrame(columns=['appid'])
 
-    try:
-        for requirements, appid in zip(df[param], df['appid']):
-            if type(requirements) != float:
-                result = {'appid': appid}
-                for x in requirements.split('<li>')[1:]:
-                    temp = [x.strip() for x in remove_tags(x).split(':')]
-                    try:
-                        result[temp[0]] = temp[1]
-                    except:
-                        result['Other'] = temp[0]
-                results.append(result)
-
-        requirements_df = pd.DataFrame(results)
-        requirements_df.columns = ['_'.join(x.lower().split()) for x in requirements_df.columns]
-
-        for x in requirements_df:
-            requirements_df[x] = requirements_df[x].replace('n/a', np.nan)
-
-        return requirements_df
-    except:
-        return requirements_df
+    html_requirements = df.set_index('appid')[param]
+    html_requirements = html_requirements[html_requirements.map(lambda x: isinstance(x, str))]
+
+    # the text before the first item is the 'Minimum:' or 'Recommended:' header
+    items = html_requirements.str.split('<li>').explode()
+    items = clean_text(items[items.groupby(level=0).cumcount() > 0])
+
+    requirements_df = pd.DataFrame(index=html_requirements.index.unique())
+    if not items.empty:
+        parts = items.str.split(':', n=1, expand=True).reindex(columns=[0, 1])
+        named = parts[1].notna()
+        keys = parts[0].where(named, 'other').str.lower().str.replace(REQUIREMENT_KEY_PATTERN, '_', regex=True)
+        values = parts[1].where(named, parts[0]).str.strip()
+        values = values.mask(values.str.lower() == 'n/a')
+
+        long_df = pd.DataFrame({'appid': items.index, 'key': keys.str.strip('_').values, 'value': values.values})
+        long_df = long_df[long_df['key'] != ''].drop_duplicates(['appid', 'key'], keep='last')
+        requirements_df = requirements_df.join(long_df.pivot(index='appid', columns='key', values='value'))
+
+    requirements_df = requirements_df.join(requirements.get_hardware_df(requirements_df))
+    requirements_df.index.name = 'appid'
+    return schema.apply(requirements_df.reset_index(), REQUIREMENTS_DTYPES)
+
+
+# requirement tables saved before the keys were normalized have columns like 'os_*' and no hardware columns,
+# the columns are renamed as get_requirements_df names them (combining those that now share a name)
+# and the hardware columns are parsed from the saved texts
+def migrate_requirements_df(df):
+    if set(requirements.HARDWARE_DTYPES).issubset(df.columns):
+        return df
+
+    df = df.set_index('appid')
+    keys = df.columns.str.lower().str.replace(REQUIREMENT_KEY_PATTERN, '_', regex=True).str.strip('_')
+    requirements_df = pd.DataFrame(index=df.index)
+    for key, column in zip(keys, df.columns):
+        if key:
+            requirements_df[key] = requirements_df[key].fillna(df[column]) if key in requirements_df else df[column]
+
+    requirements_df = requirements_df.join(requirements.get_hardware_df(requirements_df))
+    return schema.apply(requirements_df.reset_index(), REQUIREMENTS_DTYPES)
 
 
 def get_requirements_minimum_df(df):
@@ -307,7 +523,7 @@ def get_requirements_recommended_df(df):
 
 
 def get_descriptions_df(df):
-    descriptions_df = df[['detailed_description', 'about_the_game', 'short_description']]
+    descriptions_df = df[['appid', 'detailed_description', 'about_the_game', 'short_description']]
     return descriptions_df
 
 
@@ -335,7 +551,7 @@ def estimate_revenue(owners,
 
 def get_owners(df):
     owners = [estimate_owners(reviews, year) for reviews, year in zip(
-        df['reviews_total'], df['release_year'])]
+        df['reviews_total'], df['release_year'].astype(float))]
     return owners
 
 
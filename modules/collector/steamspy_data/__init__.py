@@ -1,59 +1,136 @@
 import pandas as pd
 import json
-import requests
-import datetime
-import time
 from tqdm import tqdm
 from utilities.exceptions import ServiceUnavailableException, TooManyRequestsException, NotFoundException
+from utilities import client, schema
+from utilities.schema import OTHER
+from utilities.limiter import TokenBucket
 
 STEAMSPY_ENDPOINT = 'https://steamspy.com/api.php?request=appdetails&appid={}'
+STEAMSPY_ALL_ENDPOINT = 'https://steamspy.com/api.php?request=all&page={}'
+STEAMSPY_COLUMNS = ['appid', 'positive', 'negative', 'average_forever', 'median_forever']
 
+# schemas of the cleaned tables (see utilities.schema), playtime is in minutes and tags are shares of the top tag
+STEAMSPY_DTYPES = {'appid': 'int32', 'positive': 'int32', 'negative': 'int32', 'playtime_mean': 'int32',
+                   'playtime_median': 'int32'}
+TAGS_DTYPES = {'appid': 'int32', OTHER: 'float32'}
 
-def get_steamspy_df(appids, basket_timelimit=60, basket_countlimit=60):
-    function_desc = 'collecting SteamSpy data'
-    results = []
+# request=all lists PAGE_SIZE apps per page with everything but tags, and SteamSpy allows one such request per minute
+# appdetails requests go at about 60 per minute (see get_steamspy_df)
+PAGE_SIZE = 1000
+PAGE_PERIOD = 60
+APPDETAILS_PER_MINUTE = 60
 
-    basket_start = datetime.datetime.now()
-    total_count = 0
-    for appid in tqdm(appids, desc=function_desc.upper()):
-        try:
-            basket_duration = (datetime.datetime.now() - basket_start).seconds
-            total_count += 1
+# apps with fewer reviews (positive + negative) are not worth a per-app request for their tags
+TAGS_MIN_REVIEWS = 10
 
-            if basket_duration >= basket_timelimit:
-                basket_start = datetime.datetime.now()
 
-            if total_count / basket_countlimit == total_count // basket_countlimit:
-                time.sleep(basket_timelimit - basket_duration + 1)
+def parse_steamspy(appid, content):
+    response_formatted = pd.json_normalize(json.loads(content))
+    response_formatted.columns = [col.replace(f'{appid}.', '') for col in response_formatted.columns]
+    return response_formatted
 
-            response = requests.get(STEAMSPY_ENDPOINT.format(appid))
 
-            if response.status_code == 503:
-                raise ServiceUnavailableException
-            if response.status_code == 429:
-                raise TooManyRequestsException
-            if response.status_code == 404:
-                raise NotFoundException
+# SteamSpy allows 1 appdetails request per second, the adaptive limiter of the host paces the requests
+def get_steamspy_df(appids, checkpoint=None):
+    function_desc = 'collecting SteamSpy data'
+    results = []
+    todo = appids if checkpoint is None else checkpoint.remaining(appids)
 
-            response_formatted = pd.json_normalize(json.loads(response.content))
-            response_formatted.columns = [col.replace(f'{appid}.', '') for col in response_formatted.columns]
-            results.append(response_formatted)
+    for appid in tqdm(todo, desc=function_desc.upper()):
+        try:
+            results.append(client.get_parsed(STEAMSPY_ENDPOINT.format(appid),
+                                             lambda response: parse_steamspy(appid, response.content)))
+            if checkpoint is not None:
+                checkpoint.add(appid, results[-1])
 
         except TooManyRequestsException:
             print(f'Too many requests')
-            print(
-                f'Basket duration: {basket_duration} | Basket count: {total_count - total_count // basket_countlimit * basket_countlimit}')
-            return pd.concat(results)
+            break
         except ServiceUnavailableException:
             print(f'Service unavailable for app {appid} ')
         except NotFoundException:
             print(f'App {appid} not found ')
         except:
+            if checkpoint is not None:
+                checkpoint.flush()
             raise
 
+    if checkpoint is not None:
+        results = checkpoint.results(appids)
+    if not results:
+        return pd.DataFrame(columns=STEAMSPY_COLUMNS)
     return pd.concat(results)
 
 
+def parse_steamspy_page(content):
+    apps = json.loads(content)
+    return pd.DataFrame.from_dict(apps, orient='index').reset_index(drop=True)
+
+
+# pages are requested until an empty one, with a checkpoint the pages stored in a previous run are not requested again
+# apps can move between pages while we go through them, so an app listed twice keeps its last row
+def get_steamspy_all_df(max_pages=None, checkpoint=None):
+    function_desc = 'collecting SteamSpy pages'
+    bucket = TokenBucket(1 / PAGE_PERIOD, 1, name='steamspy pages')
+    saved = checkpoint.load() if checkpoint is not None else {}
+    results = []
+
+    page = 0
+    with tqdm(desc=function_desc.upper()) as pbar:
+        while max_pages is None or page < max_pages:
+            if page in saved:
+                result = saved[page]
+            else:
+                bucket.acquire()
+                try:
+                    result = client.get_parsed(STEAMSPY_ALL_ENDPOINT.format(page),
+                                               lambda response: parse_steamspy_page(response.content),
+                                               revalidate=False)
+                except TooManyRequestsException:
+                    print(f'Too many requests')
+                    break
+                except ServiceUnavailableException:
+                    print(f'Service unavailable for page {page}')
+                    break
+                if checkpoint is not None:
+                    checkpoint.add(page, result)
+
+            if result.empty:
+                break
+            results.append(result)
+            page += 1
+            pbar.update(1)
+
+    if checkpoint is not None:
+        checkpoint.flush()
+    if not results:
+        return pd.DataFrame(columns=STEAMSPY_COLUMNS)
+
+    df = pd.concat(results).drop_duplicates('appid', keep='last')
+    df['appid'] = df['appid'].astype(int)
+    return df.reset_index(drop=True)
+
+
+# the listing costs a request per PAGE_SIZE known apps at one per minute, appdetails a request per app
+def is_bulk_cheaper(appid_count, known_count):
+    pages = known_count // PAGE_SIZE + 1
+    return appid_count / APPDETAILS_PER_MINUTE > pages * PAGE_PERIOD / 60
+
+
+# of the listed apps, those with enough reviews need appdetails for their tags
+def get_tag_appids(bulk_df, appids):
+    reviews = bulk_df.set_index('appid')[['positive', 'negative']].sum(axis=1)
+    enough = set(reviews[reviews >= TAGS_MIN_REVIEWS].index)
+    return [appid for appid in appids if appid in enough]
+
+
+# appids of the rows whose appdetails came back with at least one tag (SteamSpy sends an empty list when it has none)
+def get_tagged_appids(df):
+    tags = df[[x for x in df.columns if x.split('.')[0] == 'tags' and x != 'tags']]
+    return set(df.loc[tags.notna().any(axis=1), 'appid'])
+
+
 def get_tags_df(df):
     columns = ['appid']
     for x in df.columns:
@@ -74,14 +151,14 @@ def normalize_tags_df(df):
     df = df.fillna(0)
     df = df.divide(df.max(axis=1), axis=0)
 
-    return df.reset_index()
+    return schema.apply(df.reset_index(), TAGS_DTYPES)
 
 
 def clean_steam_spy_df(df):
     df = df[['appid', 'positive', 'negative', 'average_forever', 'median_forever']].rename(columns={
         'average_forever': 'playtime_mean', 'median_forever': 'playtime_median'})
 
-    return df.reset_index(drop=True)
+    return schema.apply(df.reset_index(drop=True), STEAMSPY_DTYPES)
 
 
 def get_playtime_df(df):
@@ -0,0 +1,85 @@
+import os
+import glob
+import shutil
+import pickle
+import threading
+
+CHECKPOINT_PATH = 'data/checkpoints/'
+SHARD_SIZE = 200
+
+
+# per-appid results of a fetch stage are streamed into append-only pickle shards
+# a shard is written (atomically) before its keys are appended to the cursor file
+# so after a crash the cursor never points at results that are not on disk, and a rerun skips exactly those keys
+class Checkpoint:
+    def __init__(self, stage, path=None, shard_size=SHARD_SIZE):
+        self.folder = os.path.join(path or CHECKPOINT_PATH, stage)
+        self.cursor_path = os.path.join(self.folder, 'cursor.txt')
+        self.shard_size = shard_size
+        self.buffer = {}
+        self.lock = threading.Lock()
+
+        if not os.path.exists(self.folder):
+            os.makedirs(self.folder)
+
+        self.done = set()
+        if os.path.exists(self.cursor_path):
+            with open(self.cursor_path) as handle:
+                self.done = {line.strip() for line in handle if line.strip()}
+
+        self.shard_count = len(glob.glob(os.path.join(self.folder, 'shard_*.pkl')))
+
+    def is_done(self, key):
+        return str(key) in self.done
+
+    def remaining(self, keys):
+        return [key for key in keys if str(key) not in self.done]
+
+    def add(self, key, result):
+        with self.lock:
+            self.buffer[key] = result
+            if len(self.buffer) >= self.shard_size:
+                self.write_shard()
+
+    def flush(self):
+        with self.lock:
+            if self.buffer:
+                self.write_shard()
+
+    def write_shard(self):
+        shard_path = os.path.join(self.folder, f'shard_{self.shard_count:06d}.pkl')
+        with open(shard_path + '.tmp', 'wb') as handle:
+            pickle.dump(self.buffer, handle, protocol=pickle.HIGHEST_PROTOCOL)
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(shard_path + '.tmp', shard_path)
+
+        with open(self.cursor_path, 'a') as handle:
+            handle.write(''.join(f'{key}\n' for key in self.buffer))
+            handle.flush()
+            os.fsync(handle.fileno())
+
+        self.done.update(str(key) for key in self.buffer)
+        self.shard_count += 1
+        self.buffer = {}
+
+    # everything stored so far, later shards win if a key was stored twice
+    def load(self):
+        self.flush()
+        results = {}
+        for shard_path in sorted(glob.glob(os.path.join(self.folder, 'shard_*.pkl'))):
+            with open(shard_path, 'rb') as handle:
+                results.update(pickle.load(handle))
+        return results
+
+    # results of the given keys stored so far, in the order of keys
+    def results(self, keys):
+        saved = self.load()
+        return [saved[key] for key in keys if key in saved]
+
+    def clear(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+
+def clear_all(path=None):
+    shutil.rmtree(path or CHECKPOINT_PATH, ignore_errors=True)
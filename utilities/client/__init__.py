@@ -0,0 +1,216 @@
+import os
+import time
+import random
+import shelve
+import threading
+import requests
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from utilities.exceptions import ServiceUnavailableException, TooManyRequestsException, NotFoundException
+from utilities import metrics
+from utilities.limiter import AdaptiveLimiter, TokenBucket
+
+CACHE_PATH = 'data/http_cache'
+POOL_SIZE = 32
+
+# max number of simultaneous requests per host, no matter how many threads are calling the client
+HOST_LIMITS = {'steampricehistory.com': 8,
+               'steamplayercount.com': 8,
+               'api.igdb.com': 8}
+DEFAULT_HOST_LIMIT = 16
+
+# starting and max requests per second per host, the adaptive limiter of the host moves between them (see get_limiter)
+# Steam store allows about 200 requests per 5 minutes, SteamSpy appdetails 1 per second and IGDB 4 per second
+# hosts with a documented budget never go above it, the limiter only backs off below it
+HOST_RATES = {'store.steampowered.com': (200 / 300, 200 / 300),
+              'steamspy.com': (1, 2),
+              'api.igdb.com': (4, 4),
+              'steampricehistory.com': (8, 32),
+              'steamplayercount.com': (8, 32)}
+DEFAULT_RATE = (8, 32)
+
+# (requests, seconds) budgets enforced by a token bucket in front of the adaptive limiter (see limiter.TokenBucket)
+# appdetails, appreviews and price_overview share the store budget, Steam answers overuse with long IP blocks
+HOST_BUDGETS = {'store.steampowered.com': (200, 300)}
+
+# 429 and 503 responses are retried after a jittered, growing pause (or Retry-After, if longer)
+# 503 also means that Steam has no data for an app, so it gets fewer retries
+RETRIES = {429: 8, 503: 2}
+MAX_BACKOFF = 300
+
+# requests (urllib3) decodes brotli only when the brotli package is installed
+try:
+    import brotli
+    ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    ACCEPT_ENCODING = 'gzip, deflate'
+
+# host -> base url that requests to the host are sent to instead, e.g. a local stand-in server for benchmarks
+# https://store.steampowered.com/api/appdetails?appids=620 goes to <base url>/store.steampowered.com/api/appdetails?...
+REDIRECTS = {}
+
+sessions = {}
+limiters = {}
+sessions_lock = threading.Lock()
+
+
+def get_host(url):
+    return urlsplit(url).netloc
+
+
+def resolve(url):
+    parts = urlsplit(url)
+    if parts.netloc not in REDIRECTS:
+        return url
+    query = f'?{parts.query}' if parts.query else ''
+    return f"{REDIRECTS[parts.netloc].rstrip('/')}/{parts.netloc}{parts.path}{query}"
+
+
+# one session per host, so connections are kept alive and reused instead of a new TCP+TLS handshake per call
+def get_session(url):
+    host = urlsplit(url).netloc
+    with sessions_lock:
+        if host not in sessions:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers['Accept-Encoding'] = ACCEPT_ENCODING
+            sessions[host] = session
+        return sessions[host]
+
+
+# one adaptive limiter per host, shared by every thread and asyncio loop calling the host
+def get_limiter(url):
+    host = get_host(url)
+    with sessions_lock:
+        if host not in limiters:
+            rate, max_rate = HOST_RATES.get(host, DEFAULT_RATE)
+            limit = HOST_LIMITS.get(host, DEFAULT_HOST_LIMIT)
+            ceiling = None
+            if host in HOST_BUDGETS:
+                ceiling = TokenBucket.from_budget(*HOST_BUDGETS[host], name=f'{host} budget')
+            limiters[host] = AdaptiveLimiter(rate, max_rate, limit, limit, ceiling=ceiling, name=host)
+        return limiters[host]
+
+
+def get_retry_after(headers):
+    try:
+        return float(headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+def get_backoff(attempt, retry_after=None):
+    backoff = min(MAX_BACKOFF, 2 ** attempt) * (0.5 + random.random())
+    return max(backoff, retry_after or 0)
+
+
+# every request waits for the limiter of its host and reports the response status back to it
+# 429 and 503 are retried (see RETRIES), the response of the last attempt is returned whatever its status
+# limiters and metrics belong to the original host, also when the request is redirected
+def request(method, url, **kwargs):
+    host = get_host(url)
+    limiter = get_limiter(url)
+    attempt = 0
+    while True:
+        limiter.acquire()
+        started = time.perf_counter()
+        try:
+            response = get_session(resolve(url)).request(method, resolve(url), **kwargs)
+        except Exception:
+            limiter.release()
+            raise
+        retry_after = get_retry_after(response.headers)
+        limiter.release(response.status_code, retry_after)
+        metrics.observe_request(host, response.status_code, time.perf_counter() - started, len(response.content))
+
+        if attempt >= RETRIES.get(response.status_code, 0):
+            return response
+        backoff = get_backoff(attempt, retry_after)
+        metrics.observe_wait(f'{host} backoff', backoff)
+        time.sleep(backoff)
+        attempt += 1
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
+
+
+def raise_for_status(status_code):
+    if status_code == 503:
+        raise ServiceUnavailableException
+    if status_code == 429:
+        raise TooManyRequestsException
+    if status_code == 404:
+        raise NotFoundException
+
+
+# ETag / Last-Modified of every fetched url together with the already parsed result
+# so on 304 we skip both the download and the parsing
+class ValidatorStore:
+    def __init__(self, path=CACHE_PATH):
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        self.shelf = shelve.open(path)
+        self.lock = threading.Lock()
+
+    def conditional_headers(self, url):
+        with self.lock:
+            entry = self.shelf.get(url)
+        headers = {}
+        if entry is not None:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def load(self, url):
+        with self.lock:
+            return self.shelf[url]['parsed']
+
+    def save(self, url, headers, parsed):
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        if etag or last_modified:
+            with self.lock:
+                self.shelf[url] = {'etag': etag, 'last_modified': last_modified, 'parsed': parsed}
+
+    def close(self):
+        with self.lock:
+            self.shelf.close()
+
+
+store = None
+store_lock = threading.Lock()
+
+
+def get_store():
+    global store
+    with store_lock:
+        if store is None:
+            store = ValidatorStore()
+        return store
+
+
+# parse gets the response and its result is what the caller receives, either fresh or from the store on 304
+def get_parsed(url, parse, revalidate=True, **kwargs):
+    headers = kwargs.pop('headers', {})
+    if revalidate:
+        headers = {**get_store().conditional_headers(url), **headers}
+
+    response = get(url, headers=headers, **kwargs)
+    if response.status_code == 304:
+        return get_store().load(url)
+    raise_for_status(response.status_code)
+
+    parsed = parse(response)
+    if revalidate:
+        get_store().save(url, response.headers, parsed)
+    return parsed
@@ -0,0 +1,155 @@
+import os
+import pickle
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from utilities.checkpoint import CHECKPOINT_PATH
+from utilities import metrics
+
+# outputs of finished stages live next to the fetch checkpoints, so utilities.checkpoint.clear_all removes them too
+CACHE_PATH = os.path.join(CHECKPOINT_PATH, 'stages')
+
+
+# a stage is a function called with its named inputs as keyword arguments, returning a dict of its named outputs
+class Stage:
+    def __init__(self, name, func, inputs=(), outputs=()):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+
+    def __repr__(self):
+        return f'Stage({self.name!r}, inputs={self.inputs}, outputs={self.outputs})'
+
+
+def digest(value):
+    return hashlib.sha1(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)).hexdigest()
+
+
+# every output is produced by exactly one stage, every input is some stage's output (or given) and there are no cycles
+def validate(stages, given=()):
+    producers = {}
+    for stage in stages:
+        for output in stage.outputs:
+            if output in producers:
+                raise ValueError(f'{output} is produced by both {producers[output].name} and {stage.name}')
+            producers[output] = stage
+
+    for stage in stages:
+        missing = [x for x in stage.inputs if x not in producers and x not in given]
+        if missing:
+            raise ValueError(f'inputs {missing} of {stage.name} are not produced by any stage')
+
+    available = set(given)
+    pending = list(stages)
+    while pending:
+        ready = [stage for stage in pending if all(x in available for x in stage.inputs)]
+        if not ready:
+            raise ValueError(f'stages {[stage.name for stage in pending]} depend on each other')
+        for stage in ready:
+            pending.remove(stage)
+            available.update(stage.outputs)
+
+
+# the cache key of a stage is derived from the content of its inputs
+# so a stage is skipped only when everything upstream of it produced exactly the same data
+class StageCache:
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+
+    def get_path(self, stage):
+        return os.path.join(self.path, f'{stage.name}.pkl')
+
+    @staticmethod
+    def get_key(stage, input_digests):
+        return digest((stage.name, [input_digests[x] for x in stage.inputs]))
+
+    def load(self, stage, key):
+        path = self.get_path(stage)
+        if not os.path.exists(path):
+            return None
+
+        with open(path, 'rb') as handle:
+            entry = pickle.load(handle)
+        if entry['key'] != key:
+            return None
+        return entry['outputs'], entry['digests']
+
+    def save(self, stage, key, outputs, digests):
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+
+        path = self.get_path(stage)
+        with open(path + '.tmp', 'wb') as handle:
+            pickle.dump({'key': key, 'outputs': outputs, 'digests': digests}, handle,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+
+
+# wall and cpu time of every stage and the number of rows of every output with a length go to utilities.metrics
+def execute(stage, values, key, cache):
+    with metrics.stage_timer(stage.name):
+        outputs = stage.func(**{x: values[x] for x in stage.inputs})
+    if set(outputs) != set(stage.outputs):
+        raise ValueError(f'{stage.name} returned {sorted(outputs)} instead of {sorted(stage.outputs)}')
+
+    for name, value in outputs.items():
+        if hasattr(value, '__len__'):
+            metrics.observe_rows(stage.name, name, len(value))
+
+    if cache is None:
+        return outputs, {}
+
+    digests = {x: digest(outputs[x]) for x in stage.outputs}
+    cache.save(stage, key, outputs, digests)
+    return outputs, digests
+
+
+# runs every stage as soon as all its inputs are available, independent stages run concurrently
+# with a cache, stages whose inputs did not change since they last finished are not run again
+# if a stage fails, no new stages are started, the running ones are finished (and cached) and the error is raised
+# values are inputs given from outside instead of being produced by a stage
+def run(stages, max_workers=8, cache=None, values=None):
+    values = dict(values or {})
+    validate(stages, values)
+
+    digests = {name: digest(value) for name, value in values.items()} if cache is not None else {}
+    pending = list(stages)
+    running = {}
+    errors = []
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while (pending and not errors) or running:
+            ready = [stage for stage in pending if all(x in values for x in stage.inputs)] if not errors else []
+            for stage in ready:
+                pending.remove(stage)
+                key = StageCache.get_key(stage, digests) if cache is not None else None
+
+                cached = cache.load(stage, key) if cache is not None else None
+                if cached is not None:
+                    print(f'{stage.name}: inputs unchanged, using cached outputs')
+                    values.update(cached[0])
+                    digests.update(cached[1])
+                else:
+                    running[executor.submit(execute, stage, values, key, cache)] = stage
+
+            # cached stages may have made other stages ready
+            if ready and len(running) == 0:
+                continue
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                try:
+                    outputs, output_digests = future.result()
+                except Exception as error:
+                    errors.append(error)
+                    continue
+                values.update(outputs)
+                digests.update(output_digests)
+
+    if errors:
+        raise errors[0]
+    return values
@@ -9,3 +9,7 @@ class ServiceUnavailableException(Exception):
 
 class NotFoundException(Exception):
     pass
+
+
+class SchemaException(Exception):
+    pass
@@ -0,0 +1,126 @@
+import asyncio
+import threading
+import time
+from utilities import metrics
+
+
+# Token bucket: up to `burst` requests can go at once, then tokens refill at a steady rate.
+# from_budget() picks the refill rate so that no window of `period` seconds ever sees more than `count` requests
+# (burst + refilled tokens <= count), which keeps us inside the real API budget without fixed-window sleeps
+class TokenBucket:
+    def __init__(self, rate, burst=1, name='token bucket'):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_budget(cls, count, period, burst=10, name='token bucket'):
+        burst = min(burst, count - 1)
+        return cls((count - burst) / period, burst, name)
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # takes a token if there is one, otherwise returns the number of seconds to wait for the next one
+    def reserve(self):
+        with self.lock:
+            self.refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        wait = self.reserve()
+        while wait > 0:
+            metrics.observe_wait(self.name, wait)
+            time.sleep(wait)
+            wait = self.reserve()
+
+    async def acquire_async(self):
+        wait = self.reserve()
+        while wait > 0:
+            metrics.observe_wait(self.name, wait)
+            await asyncio.sleep(wait)
+            wait = self.reserve()
+
+
+# AIMD (additive increase, multiplicative decrease) limiter of one host: requests start at `rate` per second with up to
+# `concurrency` open at once; every successful response adds a little to both, every 429 or 503 halves both
+# (but not below min_rate and one request), so we settle near the highest throughput the server accepts
+# a Retry-After blocks every request to the host until it has passed
+# a ceiling (a TokenBucket of a documented budget) is a hard limit on top: every request also takes one of its tokens
+class AdaptiveLimiter:
+    DECREASE = 0.5
+    INCREASE_STEPS = 50
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, rate, max_rate, concurrency=1, max_concurrency=None, min_rate=None, ceiling=None,
+                 name='adaptive limiter'):
+        self.name = name
+        self.ceiling = ceiling
+        self.rate = rate
+        self.max_rate = max(max_rate, rate)
+        self.min_rate = min_rate or rate / 16
+        self.rate_increase = rate / self.INCREASE_STEPS
+        self.concurrency = float(concurrency)
+        self.max_concurrency = max_concurrency or concurrency
+        self.in_flight = 0
+        self.tokens = 1
+        self.updated = time.monotonic()
+        self.blocked_until = 0
+        self.lock = threading.Lock()
+
+    # takes a token and a slot if both are free, otherwise returns the number of seconds to wait before trying again
+    def reserve(self):
+        with self.lock:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            if self.in_flight >= int(self.concurrency):
+                return self.POLL_INTERVAL
+
+            self.tokens = min(1, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return (1 - self.tokens) / self.rate
+
+            self.tokens -= 1
+            self.in_flight += 1
+            return 0
+
+    def acquire(self):
+        wait = self.reserve()
+        while wait > 0:
+            metrics.observe_wait(self.name, wait)
+            time.sleep(wait)
+            wait = self.reserve()
+        if self.ceiling is not None:
+            self.ceiling.acquire()
+
+    async def acquire_async(self):
+        wait = self.reserve()
+        while wait > 0:
+            metrics.observe_wait(self.name, wait)
+            await asyncio.sleep(wait)
+            wait = self.reserve()
+        if self.ceiling is not None:
+            await self.ceiling.acquire_async()
+
+    # frees the slot and adapts to the status of the response (None if the request failed without one)
+    def release(self, status=None, retry_after=None):
+        with self.lock:
+            self.in_flight -= 1
+            if status in (429, 503):
+                self.rate = max(self.min_rate, self.rate * self.DECREASE)
+                self.concurrency = max(1.0, self.concurrency * self.DECREASE)
+                if retry_after:
+                    self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+            elif status is not None:
+                self.rate = min(self.max_rate, self.rate + self.rate_increase)
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
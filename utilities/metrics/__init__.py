@@ -0,0 +1,223 @@
+import os
+import json
+import time
+import bisect
+import random
+import datetime
+import threading
+from contextlib import contextmanager
+
+METRICS_PATH = 'data/metrics/'
+PROMETHEUS_FILE = 'collector.prom'
+
+# upper bounds (seconds) of the request latency histogram buckets, the last bucket is +Inf
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+# a uniform sample (reservoir) of at most SAMPLE_SIZE latencies per host is kept for exact tail quantiles
+SAMPLE_SIZE = 10000
+QUANTILES = [0.5, 0.95, 0.99]
+
+# everything is collected in module-level counters shared by all threads (and the asyncio loop) of a run
+# reset() starts a new run, save() writes the JSON run report and the Prometheus textfile
+lock = threading.Lock()
+latencies = {}
+samples = {}
+statuses = {}
+response_bytes = {}
+waits = {}
+stages = {}
+rows = {}
+run_started = time.time()
+
+# the stage the current thread works for, set by stage_timer and by track_cpu in pool threads
+current = threading.local()
+
+
+def reset():
+    global run_started
+    with lock:
+        for counters in (latencies, samples, statuses, response_bytes, waits, stages, rows):
+            counters.clear()
+        run_started = time.time()
+
+
+def observe_request(host, status, seconds, size):
+    with lock:
+        histogram = latencies.setdefault(host, {'buckets': [0] * (len(LATENCY_BUCKETS) + 1), 'sum': 0, 'count': 0})
+        histogram['buckets'][bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        histogram['sum'] += seconds
+        histogram['count'] += 1
+
+        sample = samples.setdefault(host, [])
+        if len(sample) < SAMPLE_SIZE:
+            sample.append(seconds)
+        else:
+            position = random.randrange(histogram['count'])
+            if position < SAMPLE_SIZE:
+                sample[position] = seconds
+        statuses[(host, status)] = statuses.get((host, status), 0) + 1
+        response_bytes[host] = response_bytes.get(host, 0) + size
+
+
+# time spent blocked by a limiter (token bucket, adaptive host limiter, backoff after 429 or 503)
+def observe_wait(limiter, seconds):
+    if seconds <= 0:
+        return
+    with lock:
+        wait = waits.setdefault(limiter, {'seconds': 0, 'count': 0})
+        wait['seconds'] += seconds
+        wait['count'] += 1
+
+
+# cpu time of a stage is that of its own thread plus that of the pool threads and worker processes it used
+# (see track_cpu and utilities.pool), so stages running at the same time do not count each other's work
+@contextmanager
+def stage_timer(stage):
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    current.stage = stage
+    try:
+        yield
+    finally:
+        current.stage = None
+        add_stage_cpu(stage, time.thread_time() - cpu_start)
+        with lock:
+            stages[stage]['wall_seconds'] = time.perf_counter() - wall_start
+
+
+def get_stage():
+    return getattr(current, 'stage', None)
+
+
+def add_stage_cpu(stage, seconds):
+    if stage is None:
+        return
+    with lock:
+        timing = stages.setdefault(stage, {'wall_seconds': 0, 'cpu_seconds': 0})
+        timing['cpu_seconds'] += seconds
+
+
+# func for a pool thread: its cpu time goes to the stage of the thread that wrapped it,
+# and pools it starts itself work for that stage too
+def track_cpu(func):
+    stage = get_stage()
+    if stage is None:
+        return func
+
+    def tracked(*args, **kwargs):
+        outer = get_stage()
+        current.stage = stage
+        start = time.thread_time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            add_stage_cpu(stage, time.thread_time() - start)
+            current.stage = outer
+
+    return tracked
+
+
+def observe_rows(stage, output, count):
+    with lock:
+        rows[(stage, output)] = count
+
+
+# nearest-rank quantiles of the sampled latencies of the given hosts (all hosts by default)
+def get_latency_quantiles(hosts=None, quantiles=QUANTILES):
+    with lock:
+        values = sorted(x for host, sample in samples.items() if hosts is None or host in hosts for x in sample)
+    if not values:
+        return {}
+    return {f'p{round(q * 100)}': values[min(len(values) - 1, int(q * len(values)))] for q in quantiles}
+
+
+def get_report():
+    with lock:
+        hosts = list(samples)
+    quantiles = {host: get_latency_quantiles([host]) for host in hosts}
+
+    with lock:
+        return {'started': datetime.datetime.fromtimestamp(run_started).isoformat(),
+                'duration_seconds': time.time() - run_started,
+                'requests': {host: {'count': histogram['count'],
+                                    'latency_sum_seconds': histogram['sum'],
+                                    'latency_quantiles_seconds': quantiles.get(host, {}),
+                                    'latency_buckets': dict(zip([str(x) for x in LATENCY_BUCKETS] + ['+Inf'],
+                                                                histogram['buckets'])),
+                                    'statuses': {str(status): count for (status_host, status), count
+                                                 in statuses.items() if status_host == host},
+                                    'bytes': response_bytes.get(host, 0)}
+                             for host, histogram in latencies.items()},
+                'rate_limit_waits': {limiter: dict(wait) for limiter, wait in waits.items()},
+                'stages': {stage: {**timing, 'rows': {output: count for (row_stage, output), count in rows.items()
+                                                      if row_stage == stage}}
+                           for stage, timing in stages.items()}}
+
+
+def format_labels(**labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels.items()) + '}'
+
+
+def get_prometheus_text():
+    lines = []
+
+    def add(name, kind, description, samples):
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        lines.extend(f'{sample_name}{format_labels(**labels)} {value}' for sample_name, labels, value in samples)
+
+    with lock:
+        histogram_samples = []
+        for host, histogram in latencies.items():
+            cumulative = 0
+            for bound, count in zip([str(x) for x in LATENCY_BUCKETS] + ['+Inf'], histogram['buckets']):
+                cumulative += count
+                histogram_samples.append(('collector_request_duration_seconds_bucket', {'host': host, 'le': bound},
+                                          cumulative))
+            histogram_samples.append(('collector_request_duration_seconds_sum', {'host': host}, histogram['sum']))
+            histogram_samples.append(('collector_request_duration_seconds_count', {'host': host}, histogram['count']))
+        add('collector_request_duration_seconds', 'histogram', 'Request latency per host.', histogram_samples)
+
+        add('collector_responses_total', 'counter', 'Responses per host and status code.',
+            [('collector_responses_total', {'host': host, 'status': status}, count)
+             for (host, status), count in statuses.items()])
+        add('collector_response_bytes_total', 'counter', 'Bytes of response bodies per host.',
+            [('collector_response_bytes_total', {'host': host}, size) for host, size in response_bytes.items()])
+        add('collector_rate_limit_wait_seconds_total', 'counter', 'Time blocked by rate limiting.',
+            [('collector_rate_limit_wait_seconds_total', {'limiter': limiter}, wait['seconds'])
+             for limiter, wait in waits.items()])
+        add('collector_stage_wall_seconds', 'gauge', 'Wall time of the last run of a stage.',
+            [('collector_stage_wall_seconds', {'stage': stage}, timing['wall_seconds'])
+             for stage, timing in stages.items()])
+        add('collector_stage_cpu_seconds', 'gauge', 'Cpu time of a stage, its pool threads and worker processes.',
+            [('collector_stage_cpu_seconds', {'stage': stage}, timing['cpu_seconds'])
+             for stage, timing in stages.items()])
+        add('collector_stage_rows', 'gauge', 'Rows of every table a stage produced.',
+            [('collector_stage_rows', {'stage': stage, 'output': output}, count)
+             for (stage, output), count in rows.items()])
+        add('collector_last_run_timestamp_seconds', 'gauge', 'Start of the last run.',
+            [('collector_last_run_timestamp_seconds', {}, run_started)])
+
+    return '\n'.join(lines) + '\n'
+
+
+def write_atomic(path, text):
+    with open(path + '.tmp', 'w') as handle:
+        handle.write(text)
+    os.replace(path + '.tmp', path)
+
+
+# the report of every run is kept as run_<start time>.json, the textfile is overwritten
+# (it is written atomically, so the node exporter never reads half a file)
+def save(path=METRICS_PATH):
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+    report = get_report()
+    name = datetime.datetime.fromtimestamp(run_started).strftime('run_%Y%m%d_%H%M%S.json')
+    write_atomic(os.path.join(path, name), json.dumps(report, indent=2))
+    write_atomic(os.path.join(path, PROMETHEUS_FILE), get_prometheus_text())
+
+    return report
@@ -1,5 +1,6 @@
 import numpy as np
 import pandas as pd
+from scipy import sparse
 
 def is_iterable(x):
     try:
@@ -9,11 +10,14 @@ def is_iterable(x):
         return False
 
 
-def empty_to_nan(x):
-    if (is_iterable(x) and len(x) == 0) or (isinstance(x, list) and x[0] == '') or (x == ''):
-        return np.nan
-    else:
-        return x
+# empty strings, empty lists and lists starting with an empty string become NaN
+# .str.len() and .str[0] work on lists as well as strings, columns of neither are returned as they are
+def empty_to_nan(series):
+    try:
+        empty = (series.str.len() == 0) | (series.str[0] == '')
+    except AttributeError:
+        return series
+    return series.mask(empty)
 
 
 def extract_from_dict_series(series, dict_key):
@@ -35,9 +39,87 @@ def get_dict_key_by_value(val, d):
     return val
 
 
+def format_column_name(x):
+    return '_'.join(x.lower().replace('-', ' ').split()) if type(x) == str else x
+
+
+# one-hot matrix of a column of lists, built directly as CSR: one stored value per (app, value) pair
+# returns the matrix and its column vocabulary (sorted unique values, like pd.get_dummies)
+def get_dummy_matrix(series):
+    values = [x if isinstance(x, (list, tuple, np.ndarray)) else [] for x in series]
+    lengths = [len(x) for x in values]
+    codes, vocabulary = pd.factorize(pd.Series([value for x in values for value in x], dtype=object), sort=True)
+
+    rows = np.repeat(np.arange(len(values)), lengths)
+    matrix = sparse.csr_matrix((np.ones(len(codes), dtype='int32'), (rows, codes)),
+                               shape=(len(values), len(vocabulary)))
+    matrix.sum_duplicates()
+
+    return matrix, list(vocabulary)
+
+
+# appid column plus one sparse column per value, apps without values get zeros
 def get_dummy_df(df, param):
-    result = df[['appid']]
-    result = result.join(pd.get_dummies(df[param].apply(pd.Series).stack()).groupby(level=0).sum())
-    result.columns = ['_'.join(x.lower().replace('-', ' ').split()) if type(x) == str else x for x in result.columns]
+    matrix, vocabulary = get_dummy_matrix(df[param])
+    result = pd.DataFrame.sparse.from_spmatrix(matrix, index=df.index,
+                                               columns=[format_column_name(x) for x in vocabulary])
+    result.insert(0, 'appid', df['appid'])
+
+    return result
+
+
+def is_sparse(df):
+    return any(isinstance(dtype, pd.SparseDtype) for dtype in df.dtypes)
+
 
+# (appids, vocabulary, CSR matrix) of a dummy DataFrame, dense or sparse, without densifying it
+def get_sparse_parts(df):
+    values = df.loc[:, df.columns != 'appid']
+    if values.columns.empty:
+        matrix = sparse.csr_matrix((len(df), 0), dtype='int32')
+    elif all(isinstance(dtype, pd.SparseDtype) for dtype in values.dtypes):
+        matrix = values.sparse.to_coo().tocsr()
+    else:
+        matrix = sparse.csr_matrix(values.fillna(0).to_numpy(dtype='float32'))
+
+    return df['appid'].to_numpy(), list(values.columns), matrix
+
+
+def from_sparse_parts(appids, vocabulary, matrix):
+    result = pd.DataFrame.sparse.from_spmatrix(matrix, columns=vocabulary)
+    result.insert(0, 'appid', appids)
     return result
+
+
+# the columns of a CSR matrix moved to the positions of their names in vocabulary
+def align_columns(matrix, own_vocabulary, vocabulary):
+    positions = pd.Index(vocabulary).get_indexer(own_vocabulary)
+    matrix = matrix.tocoo()
+    return sparse.csr_matrix((matrix.data, (matrix.row, positions[matrix.col])),
+                             shape=(matrix.shape[0], len(vocabulary)))
+
+
+# rows of new replace the rows of old with the same appid, over the values of both (a value only one side has is 0
+# on the other), so the result stays an integer CSR matrix
+def merge_sparse_parts(old, new):
+    old_appids, old_vocabulary, old_matrix = old
+    new_appids, new_vocabulary, new_matrix = new
+    vocabulary = list(dict.fromkeys(list(old_vocabulary) + list(new_vocabulary)))
+    kept = ~np.isin(old_appids, new_appids)
+
+    matrix = sparse.vstack([align_columns(old_matrix[kept], old_vocabulary, vocabulary),
+                            align_columns(new_matrix, new_vocabulary, vocabulary)], format='csr')
+    return np.concatenate([old_appids[kept], new_appids]), vocabulary, matrix
+
+
+# rows of new replace the rows of old with the same appid (all of them, so it works for long tables too)
+# sparse dummy tables are merged on their CSR parts, as concatenating them would fill missing columns with NaN
+def merge_by_appid(old, new):
+    if old is None:
+        return new
+
+    if is_sparse(old) or is_sparse(new):
+        return from_sparse_parts(*merge_sparse_parts(get_sparse_parts(old), get_sparse_parts(new)))
+
+    old = old[~old['appid'].isin(new['appid'].unique())]
+    return pd.concat([old, new]).reset_index(drop=True)
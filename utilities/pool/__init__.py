@@ -0,0 +1,79 @@
+import os
+import time
+import multiprocessing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import pandas as pd
+from tqdm import tqdm
+from utilities import metrics
+from utilities.exceptions import TooManyRequestsException, ServiceUnavailableException
+
+CHUNK_SIZE = 5000
+
+
+# runs func over items in at most max_workers threads and returns the results in the order of items
+# only a bounded window of tasks is queued at a time, so memory does not grow with the number of items
+# with a checkpoint, items done in a previous run are skipped and every new result is stored as it arrives
+# an item whose func raises one of skipped (by default a 429 or 503 that outlived the retries of utilities.client)
+# is left undone: its result is None and it is not stored, so the next run tries it again while the rest go on
+def map_ordered(func, items, max_workers=16, function_desc='', checkpoint=None,
+                skipped=(TooManyRequestsException, ServiceUnavailableException)):
+    results = []
+    window = deque()
+    todo = items if checkpoint is None else checkpoint.remaining(items)
+    func = metrics.track_cpu(func)
+
+    def collect():
+        item, future = window.popleft()
+        try:
+            results.append(future.result())
+        except skipped:
+            print(f'{item} unavailable, left for the next run')
+            results.append(None)
+        else:
+            if checkpoint is not None:
+                checkpoint.add(item, results[-1])
+        pbar.update(1)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        with tqdm(total=len(items), initial=len(items) - len(todo), desc=function_desc.upper()) as pbar:
+            try:
+                for item in todo:
+                    window.append((item, executor.submit(func, item)))
+                    if len(window) >= max_workers * 4:
+                        collect()
+
+                while window:
+                    collect()
+            finally:
+                if checkpoint is not None:
+                    checkpoint.flush()
+
+    if checkpoint is not None:
+        saved = checkpoint.load()
+        return [saved.get(item) for item in items]
+    return results
+
+
+# runs func (a module-level function of a Series returning a Series) over chunks of series in worker processes,
+# for pure-Python work such as regexes that threads cannot spread across cores, and returns the results in order
+# workers are spawned rather than forked, as the collector calls this from threads of a running stage graph
+# a series that fits in one chunk is processed here, without starting any process
+# the cpu time the workers spend on the chunks goes to the stage of the caller (see utilities.metrics)
+def map_chunks(func, series, chunk_size=CHUNK_SIZE, max_workers=None):
+    chunks = [series.iloc[i:i + chunk_size] for i in range(0, len(series), chunk_size)]
+    max_workers = min(max_workers or os.cpu_count() or 1, len(chunks))
+    if max_workers <= 1:
+        return func(series)
+
+    with ProcessPoolExecutor(max_workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        results = list(executor.map(timed, [func] * len(chunks), chunks))
+    metrics.add_stage_cpu(metrics.get_stage(), sum(seconds for _, seconds in results))
+    return pd.concat([result for result, _ in results])
+
+
+# func of a chunk and the cpu time of the worker process it took
+def timed(func, chunk):
+    start = time.process_time()
+    result = func(chunk)
+    return result, time.process_time() - start
@@ -1,5 +1,22 @@
 import pickle
 import os
+import numpy as np
+import pandas as pd
+from utilities import misc, schema as table_schema
+
+# tables can also be stored column-wise as Parquet or Arrow IPC, which allows reading only some columns
+# and only some appids (Parquet pushes the appid filter down to row groups, Arrow IPC is memory-mapped)
+# everything that is not a DataFrame, or a DataFrame pyarrow cannot convert, is pickled as before
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+TABLE_FORMATS = {'parquet': '.parquet', 'arrow': '.arrow'}
+EXTENSIONS = ['.parquet', '.arrow', '.npz', '.pkl']
+ROW_GROUP_SIZE = 10000
 
 
 def create_folder(path):
@@ -7,24 +24,137 @@ def create_folder(path):
         os.makedirs(path)
 
 
-def save(variable, path):
-    try:
-        with open(path+'.pkl', 'wb') as handle:
-            pickle.dump(variable, handle, protocol=pickle.HIGHEST_PROTOCOL)
-    except:
-        path = '/'.join(path.split('/')[:-1]) + '/'
-        print(f'creating {path} folder')
-        create_folder(path)
-        with open(path+'.pkl', 'wb') as handle:
-            pickle.dump(variable, handle, protocol=pickle.HIGHEST_PROTOCOL)
+def is_sparse(variable):
+    return isinstance(variable, pd.DataFrame) and misc.is_sparse(variable)
+
+
+# sparse dummy DataFrames are always stored as CSR parts in .npz, whatever fmt is
+# a DataFrame with a schema (see utilities.schema) is checked against it first and not saved if it does not match
+def save(variable, path, fmt='pickle', schema=None):
+    if schema is not None:
+        table_schema.validate(variable, schema, path)
+
+    if is_sparse(variable):
+        save_sparse(variable, path)
+        return
+
+    if fmt in TABLE_FORMATS and pa is not None and isinstance(variable, pd.DataFrame):
+        try:
+            save_table(variable, path, fmt)
+            return
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError, ValueError):
+            print(f'{path} cannot be stored as {fmt}, pickling it')
+
+    folder = '/'.join(path.split('/')[:-1]) + '/'
+    if not os.path.exists(folder):
+        print(f'creating {folder} folder')
+        create_folder(folder)
+    with open(path+'.pkl', 'wb') as handle:
+        pickle.dump(variable, handle, protocol=pickle.HIGHEST_PROTOCOL)
+    remove_other_formats(path, '.pkl')
+
+
+def save_table(df, path, fmt='parquet'):
+    folder = os.path.dirname(path)
+    if folder:
+        create_folder(folder)
+
+    table = pa.Table.from_pandas(df)
+    if fmt == 'parquet':
+        pq.write_table(table, path + '.parquet', row_group_size=ROW_GROUP_SIZE)
+    else:
+        with pa.OSFile(path + '.arrow', 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+    remove_other_formats(path, TABLE_FORMATS[fmt])
+
+
+# a stale file in another format would shadow the new one in find()
+def remove_other_formats(path, extension):
+    for other in EXTENSIONS:
+        if other != extension and os.path.exists(path + other):
+            os.remove(path + other)
+
 
+def save_sparse(df, path):
+    folder = os.path.dirname(path)
+    if folder:
+        create_folder(folder)
+
+    appids, vocabulary, matrix = misc.get_sparse_parts(df)
+    np.savez_compressed(path + '.npz', appids=appids, vocabulary=np.array(vocabulary, dtype=object),
+                        data=matrix.data, indices=matrix.indices, indptr=matrix.indptr, shape=matrix.shape)
+    remove_other_formats(path, '.npz')
+
+
+def load_sparse_parts(path):
+    with np.load(path, allow_pickle=True) as parts:
+        matrix = misc.sparse.csr_matrix((parts['data'], parts['indices'], parts['indptr']), shape=parts['shape'])
+        return parts['appids'], list(parts['vocabulary']), matrix
+
+
+# the rows of appids and the columns named in columns are cut from the CSR matrix before the DataFrame is built
+def load_sparse(path, columns=None, appids=None):
+    saved_appids, vocabulary, matrix = load_sparse_parts(path)
+    if appids is not None:
+        rows = np.flatnonzero(np.isin(saved_appids, list(appids)))
+        saved_appids, matrix = saved_appids[rows], matrix[rows]
+    if columns is not None:
+        positions = {column: i for i, column in enumerate(vocabulary)}
+        missing = [column for column in columns if column != 'appid' and column not in positions]
+        if missing:
+            raise KeyError(f'{missing} not in {path}')
+        vocabulary = [column for column in columns if column != 'appid']
+        matrix = matrix[:, [positions[column] for column in vocabulary]]
+
+    df = misc.from_sparse_parts(saved_appids, vocabulary, matrix)
+    return df[columns] if columns is not None else df
+
+
+# path of the saved variable whatever format it was saved in, None if there is none
+def find(path):
+    for extension in EXTENSIONS:
+        if os.path.exists(path + extension):
+            return path + extension
+    return None
+
+
+# columns and appids are applied to tables of any format, but only Parquet and Arrow files avoid reading the rest
+def load(path, columns=None, appids=None, memory_map=True):
+    if path.endswith('.parquet') or path.endswith('.arrow'):
+        return load_table(path, columns, appids, memory_map)
+    if path.endswith('.npz'):
+        return load_sparse(path, columns, appids)
 
-def load(path):
     with open(path, 'rb') as handle:
         variable = pickle.load(handle)
+
+    if isinstance(variable, pd.DataFrame):
+        if appids is not None:
+            variable = variable[variable['appid'].isin(list(appids))]
+        if columns is not None:
+            variable = variable[columns]
     return variable
 
 
+def load_table(path, columns=None, appids=None, memory_map=True):
+    if path.endswith('.parquet'):
+        filters = [('appid', 'in', list(appids))] if appids is not None else None
+        table = pq.read_table(path, columns=columns, filters=filters, memory_map=memory_map)
+    else:
+        source = pa.memory_map(path) if memory_map else pa.OSFile(path)
+        table = pa.ipc.open_file(source).read_all()
+        if appids is not None:
+            table = table.filter(pc.is_in(table['appid'], value_set=pa.array(list(appids), table['appid'].type)))
+        if columns is not None:
+            table = table.select(columns)
+
+    # text comes back as Arrow strings, as utilities.schema stores it
+    text = pd.api.types.pandas_dtype(table_schema.TEXT)
+    return table.to_pandas(types_mapper={pa.string(): text, pa.large_string(): text}.get)
+
+
 def save_txt(string, path, append=False):
     if append:
         mode = 'a'
@@ -0,0 +1,54 @@
+import pandas as pd
+from utilities.exceptions import SchemaException
+
+# a schema maps column names of a table to compact dtypes: 'category' for repeated labels (developers, engines),
+# numpy 'int32'/'float32' for columns without gaps (float NaN is fine), nullable 'Int32' for integers with gaps,
+# 'bool', 'datetime64[ns]' and TEXT for free text
+# columns the schema does not name get the dtype of OTHER if it is in the schema and are left alone otherwise
+# (lists of genres, screenshots, etc. stay Python objects)
+try:
+    import pyarrow
+    TEXT = 'string[pyarrow]'
+except ImportError:
+    TEXT = 'string'
+
+OTHER = '*'
+
+
+def get_dtype(schema, column):
+    return schema.get(column, schema.get(OTHER))
+
+
+def cast(series, dtype):
+    if series.dtype == dtype:
+        return series
+    if dtype == 'bool':
+        return series.fillna(False).astype(bool)
+    if dtype.startswith('datetime64'):
+        return pd.to_datetime(series, errors='coerce').astype(dtype)
+    if dtype in ('category', TEXT):
+        return series.astype(dtype)
+    # numbers may come as strings or as floats with NaN (e.g. after a reindex)
+    return pd.to_numeric(series, errors='coerce').astype(dtype)
+
+
+# applied where a table is cleaned and again after it is merged with the saved one
+# (categoricals with different categories concatenate to object)
+def apply(df, schema):
+    df = df.copy()
+    for column in df.columns:
+        dtype = get_dtype(schema, column)
+        if dtype is None:
+            continue
+        try:
+            df[column] = cast(df[column], dtype)
+        except (TypeError, ValueError) as error:
+            raise SchemaException(f'column {column} cannot be cast to {dtype}: {error}')
+    return df
+
+
+def validate(df, schema, name='table'):
+    mismatches = [f'{column} is {df[column].dtype}, not {get_dtype(schema, column)}' for column in df.columns
+                  if get_dtype(schema, column) is not None and df[column].dtype != get_dtype(schema, column)]
+    if mismatches:
+        raise SchemaException(f'{name} does not match its schema: ' + ', '.join(mismatches))
@@ -0,0 +1,77 @@
+import re
+import pandas as pd
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+BREAKDOWN_TABLE_CLASS = 'breakdown-table'
+
+
+def get_class_pattern(class_name):
+    return re.compile(r'<(\w+)[^>]*\bclass\s*=\s*["\'][^"\']*(?<![\w-])' + re.escape(class_name) +
+                      r'(?![\w-])[^"\']*["\'][^>]*>', re.IGNORECASE)
+
+
+CLASS_PATTERNS = {BREAKDOWN_TABLE_CLASS: get_class_pattern(BREAKDOWN_TABLE_CLASS)}
+
+
+# cuts the first element with the given class out of the page by matching its opening and closing tags
+# so only that element is ever parsed
+def slice_element(html, class_name):
+    if class_name not in CLASS_PATTERNS:
+        CLASS_PATTERNS[class_name] = get_class_pattern(class_name)
+
+    match = CLASS_PATTERNS[class_name].search(html)
+    if match is None:
+        raise ValueError(f'No element with class {class_name}')
+
+    tag_pattern = re.compile(rf'<(/?){match.group(1)}\b[^>]*>', re.IGNORECASE)
+    depth = 0
+    for tag in tag_pattern.finditer(html, match.start()):
+        depth += -1 if tag.group(1) else 1
+        if depth == 0:
+            return html[match.start():tag.end()]
+
+    raise ValueError(f'Element with class {class_name} is not closed')
+
+
+def get_rows_fast(html, class_name):
+    fragment = slice_element(html, class_name)
+
+    if lxml is None:
+        from bs4 import BeautifulSoup
+
+        element = BeautifulSoup(fragment, 'html.parser')
+        return [[td.get_text(strip=True) for td in tr.find_all(['td', 'th'])] for tr in element.find_all('tr')]
+
+    element = lxml.html.fragment_fromstring(fragment)
+    return [[''.join(text.strip() for text in td.itertext()) for td in tr.iter('td', 'th')]
+            for tr in element.iter('tr')]
+
+
+# the original approach: the whole page as a BeautifulSoup tree
+def get_rows_full(html, class_name):
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, 'html.parser')
+
+    tables = [
+        [
+            [td.get_text(strip=True) for td in tr.find_all(lambda tag: tag.name == 'td' or tag.name == 'th')]
+            for tr in table.find_all('tr')
+        ]
+        for table in soup.find_all(class_=class_name)
+    ]
+
+    return tables[0]
+
+
+def extract_table(html, class_name=BREAKDOWN_TABLE_CLASS):
+    try:
+        rows = get_rows_fast(html, class_name)
+        return pd.DataFrame(data=rows[1:], columns=rows[0])
+    except Exception:
+        rows = get_rows_full(html, class_name)
+        return pd.DataFrame(data=rows[1:], columns=rows[0])